@@ -1,12 +1,21 @@
+import os
+import asyncio
 from fastapi import FastAPI, HTTPException, Body
 from pydantic import BaseModel, Field, HttpUrl
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import httpx # To call our other agents (API Agent)
+from http_clients import get_http_client
 
 app = FastAPI()
 
 # URLs for other agents this agent might need to call
 API_AGENT_URL = "http://127.0.0.1:8001" # For fetching stock prices
+# Symbols per /stock/batch call, and max batch calls in flight (the API Agent rate-limits AlphaVantage itself)
+PRICE_BATCH_SIZE = int(os.getenv("PRICE_BATCH_SIZE", "100"))
+PRICE_FETCH_CONCURRENCY = int(os.getenv("PRICE_FETCH_CONCURRENCY", "5"))
+# Deadline the API Agent gets per batch; the client waits a little longer so partial results still arrive
+PRICE_BATCH_DEADLINE_SECONDS = float(os.getenv("PRICE_BATCH_DEADLINE_SECONDS", "20"))
+PRICE_BATCH_TIMEOUT_MARGIN_SECONDS = 10
 
 # --- Mocked Portfolio Data ---
 # In a real system, this would come from a database or portfolio management system.
@@ -61,23 +70,63 @@ class AnalysisResponse(BaseModel):
     earnings_surprises: List[EarningsSurpriseInfo] = []
     key_news_headlines: List[str] = [] # A few relevant headlines
     regional_sentiment_raw_indicators: List[str] = []
+    dropped_symbols: List[str] = [] # Holdings left out of the AUM calculation because no price was available
 
 
-async def get_stock_data_from_api_agent(symbol: str) -> Optional[StockPriceData]:
+async def get_stock_data_batch_from_api_agent(symbols: List[str]) -> Dict[str, StockPriceData]:
+    """Fetches prices for many symbols in one /stock/batch call. Symbols the API Agent couldn't price are left out."""
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(f"{API_AGENT_URL}/stock/{symbol}")
-            response.raise_for_status()
-            data = response.json()
-            # Ensure the fields match what StockPriceData expects (floats for prices)
-            return StockPriceData(
-                symbol=data["symbol"],
-                latest_close=float(data["latest_close"]),
-                previous_close=float(data["previous_close"])
+        client = get_http_client("api_agent", timeout=30.0)
+        response = await client.post(
+            f"{API_AGENT_URL}/stock/batch",
+            json={"symbols": symbols, "deadline_seconds": PRICE_BATCH_DEADLINE_SECONDS},
+            timeout=PRICE_BATCH_DEADLINE_SECONDS + PRICE_BATCH_TIMEOUT_MARGIN_SECONDS,
+        )
+        response.raise_for_status()
+        data = response.json()
+        for symbol, error in data.get("errors", {}).items():
+            print(f"AnalysisAgent: API Agent could not price {symbol}: {error}")
+        # Ensure the fields match what StockPriceData expects (floats for prices)
+        return {
+            symbol: StockPriceData(
+                symbol=stock["symbol"],
+                latest_close=float(stock["latest_close"]),
+                previous_close=float(stock["previous_close"])
             )
+            for symbol, stock in data.get("stocks", {}).items()
+        }
     except Exception as e:
-        print(f"AnalysisAgent: Error fetching price for {symbol} from API Agent: {e}")
-        return None
+        print(f"AnalysisAgent: Error fetching prices for {len(symbols)} symbols from API Agent: {e}")
+        return {}
+
+async def fetch_prices_for_holdings(holdings: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Fetches prices for all holdings via the batch endpoint, PRICE_BATCH_SIZE symbols per call,
+    with at most PRICE_FETCH_CONCURRENCY batch calls in flight.
+    Returns the holdings merged with their price data, plus the symbols that could not be priced.
+    """
+    symbols = list(dict.fromkeys(holding["symbol"].upper() for holding in holdings))
+    symbol_batches = [symbols[i:i + PRICE_BATCH_SIZE] for i in range(0, len(symbols), PRICE_BATCH_SIZE)]
+    semaphore = asyncio.Semaphore(PRICE_FETCH_CONCURRENCY)
+
+    async def fetch_with_limit(batch: List[str]) -> Dict[str, StockPriceData]:
+        async with semaphore:
+            return await get_stock_data_batch_from_api_agent(batch)
+
+    prices_by_symbol: Dict[str, StockPriceData] = {}
+    for batch_prices in await asyncio.gather(*(fetch_with_limit(batch) for batch in symbol_batches)):
+        prices_by_symbol.update(batch_prices)
+
+    holdings_with_prices = []
+    dropped_symbols = []
+    for holding in holdings:
+        price_data = prices_by_symbol.get(holding["symbol"].upper())
+        if price_data:
+            holdings_with_prices.append({**holding, **price_data.dict()})
+        else:
+            print(f"AnalysisAgent: Warning - could not get price for {holding['symbol']} for AUM calculation.")
+            dropped_symbols.append(holding["symbol"])
+    return holdings_with_prices, dropped_symbols
 
 @app.post("/analyze_market_data", response_model=AnalysisResponse)
 async def analyze_market_data(request: AnalysisRequest = Body(...)):
@@ -93,15 +142,8 @@ async def analyze_market_data(request: AnalysisRequest = Body(...)):
     current_asia_tech_value = 0.0
     yesterday_asia_tech_value = 0.0
 
-    portfolio_holdings_with_prices = []
-    for holding in MOCK_PORTFOLIO["holdings"]:
-        price_data = await get_stock_data_from_api_agent(holding["symbol"])
-        if price_data:
-            portfolio_holdings_with_prices.append({**holding, **price_data.dict()})
-        else:
-
-            print(f"AnalysisAgent: Warning - could not get price for {holding['symbol']} for AUM calculation.")
-            continue # Skip this holding if no price data
+    # Holdings without price data are skipped and reported back as dropped_symbols
+    portfolio_holdings_with_prices, dropped_symbols = await fetch_prices_for_holdings(MOCK_PORTFOLIO["holdings"])
 
     if not portfolio_holdings_with_prices:
         print("AnalysisAgent: Error - No price data for any portfolio holdings. Cannot calculate AUM.")
@@ -170,5 +212,6 @@ async def analyze_market_data(request: AnalysisRequest = Body(...)):
         asia_tech_allocation=asia_tech_allocation_result,
         earnings_surprises=earnings_surprises_list,
         key_news_headlines=unique_key_news_list,
-        regional_sentiment_raw_indicators=regional_sentiment_indicators
+        regional_sentiment_raw_indicators=regional_sentiment_indicators,
+        dropped_symbols=dropped_symbols
     )
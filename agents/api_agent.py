@@ -1,7 +1,13 @@
 # /agents/api_agent.py
 import os
+import asyncio
 from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+from typing import List, Optional
 import httpx # Using httpx for async requests
+from http_clients import get_http_client
+from price_cache import PriceCache
+from rate_limiter import TokenBucketRateLimiter, RateLimitExceeded, PRIORITY_LANES
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 
@@ -9,18 +15,58 @@ load_dotenv()
 
 ALPHA_VANTAGE_API_KEY = os.getenv("ALPHAVANTAGE_API_KEY")
 BASE_URL = "https://www.alphavantage.co/query"
+# Optional SQLite file so cached closes survive restarts; memory-only when unset
+PRICE_CACHE_DB_PATH = os.getenv("PRICE_CACHE_DB_PATH")
+# Batch endpoint: max symbols per request and max concurrent upstream fetches for cache misses
+MAX_BATCH_SYMBOLS = int(os.getenv("MAX_BATCH_SYMBOLS", "500"))
+BATCH_FETCH_CONCURRENCY = int(os.getenv("BATCH_FETCH_CONCURRENCY", "5"))
+# Plan quotas (free tier defaults). Requests queue for a slot instead of failing with a 429 "Note".
+ALPHAVANTAGE_REQUESTS_PER_MINUTE = int(os.getenv("ALPHAVANTAGE_REQUESTS_PER_MINUTE", "5"))
+ALPHAVANTAGE_REQUESTS_PER_DAY = int(os.getenv("ALPHAVANTAGE_REQUESTS_PER_DAY", "25")) # 0 = no daily quota
+# Max seconds a request may queue for a slot, per priority lane
+QUEUE_MAX_WAIT = {
+    "interactive": float(os.getenv("ALPHAVANTAGE_MAX_QUEUE_WAIT", "30")),
+    "background": float(os.getenv("ALPHAVANTAGE_BACKGROUND_MAX_QUEUE_WAIT", "300")),
+}
+# Default overall deadline for /stock/batch, per priority lane; symbols not resolved by then are reported under "errors"
+BATCH_DEADLINE_SECONDS = {
+    "interactive": float(os.getenv("ALPHAVANTAGE_BATCH_DEADLINE", "20")),
+    "background": float(os.getenv("ALPHAVANTAGE_BACKGROUND_BATCH_DEADLINE", "900")),
+}
 
 app = FastAPI()
 
-async def fetch_stock_data_alphavantage(symbol: str):
+price_cache = PriceCache(sqlite_path=PRICE_CACHE_DB_PATH)
+alphavantage_limiter = TokenBucketRateLimiter(
+    per_minute=ALPHAVANTAGE_REQUESTS_PER_MINUTE,
+    per_day=ALPHAVANTAGE_REQUESTS_PER_DAY
+)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await asyncio.to_thread(price_cache.close) # Flushes entries still queued for the on-disk cache
+
+def validate_priority(priority: str) -> str:
+    if priority not in PRIORITY_LANES:
+        raise HTTPException(status_code=400, detail=f"Unknown priority '{priority}'. Use one of: {', '.join(PRIORITY_LANES)}.")
+    return priority
+
+async def fetch_stock_data_alphavantage(symbol: str, priority: str = "interactive", max_wait: Optional[float] = None):
+    """max_wait caps the lane's queue wait further, e.g. to the time left in a batch."""
+    queue_wait = QUEUE_MAX_WAIT[priority] if max_wait is None else min(max_wait, QUEUE_MAX_WAIT[priority])
+    try:
+        await alphavantage_limiter.acquire(PRIORITY_LANES[priority], max_wait=queue_wait)
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=f"AlphaVantage rate limit: {str(e)}")
+
     params = {
         "function": "TIME_SERIES_DAILY",
         "symbol": symbol,
         "apikey": ALPHA_VANTAGE_API_KEY,
         "outputsize": "compact" # compact for fewer data points
     }
-    async with httpx.AsyncClient() as client:
-        response = await client.get(BASE_URL, params=params)
+    client = get_http_client("alphavantage")
+    response = await client.get(BASE_URL, params=params)
     
     if response.status_code != 200:
         raise HTTPException(status_code=response.status_code, detail="Error fetching data from AlphaVantage")
@@ -54,16 +100,88 @@ async def fetch_stock_data_alphavantage(symbol: str):
         "previous_close": previous_close
     }
 
+class BatchStockRequest(BaseModel):
+    symbols: List[str]
+    priority: str = "interactive" # "background" for cache warmup; yields to interactive requests
+    deadline_seconds: Optional[float] = None # Defaults to the lane's BATCH_DEADLINE_SECONDS
+
+async def get_cached_stock_data(symbol: str, priority: str = "interactive", max_wait: Optional[float] = None):
+    # Daily closes only change once per trading day; concurrent misses share one upstream call
+    return await price_cache.get_or_fetch(symbol.upper(), lambda s: fetch_stock_data_alphavantage(s, priority, max_wait))
+
+@app.post("/stock/batch")
+async def get_stock_data_batch(request: BatchStockRequest):
+    """
+    Fetches latest and previous closes for many symbols in one call.
+    Cache hits are served directly; misses are fetched concurrently (BATCH_FETCH_CONCURRENCY at a time).
+    Symbols that fail are reported under "errors" instead of failing the whole batch. The whole call
+    returns by its deadline: each miss may only queue for a rate-limit slot as long as time is left,
+    and symbols still unresolved at the deadline are listed under "errors" next to the partial "stocks".
+    """
+    if not ALPHA_VANTAGE_API_KEY:
+        raise HTTPException(status_code=500, detail="AlphaVantage API key not configured.")
+    symbols = list(dict.fromkeys(s.strip().upper() for s in request.symbols if s and s.strip()))
+    if not symbols:
+        raise HTTPException(status_code=400, detail="No symbols provided.")
+    if len(symbols) > MAX_BATCH_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"Too many symbols: {len(symbols)} (max {MAX_BATCH_SYMBOLS}).")
+    priority = validate_priority(request.priority)
+    if request.deadline_seconds is not None and request.deadline_seconds <= 0:
+        raise HTTPException(status_code=400, detail="deadline_seconds must be positive.")
+    deadline_seconds = request.deadline_seconds or BATCH_DEADLINE_SECONDS[priority]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + deadline_seconds
+
+    semaphore = asyncio.Semaphore(BATCH_FETCH_CONCURRENCY)
+
+    async def fetch_one(symbol: str):
+        cached = price_cache.get(symbol)
+        if cached is not None:
+            return cached
+        async with semaphore:
+            time_left = deadline - loop.time()
+            if time_left <= 0:
+                raise HTTPException(status_code=504, detail=f"Not fetched within the {deadline_seconds:g}s batch deadline.")
+            return await get_cached_stock_data(symbol, priority, max_wait=time_left)
+
+    tasks = [asyncio.ensure_future(fetch_one(symbol)) for symbol in symbols]
+    _, pending = await asyncio.wait(tasks, timeout=max(deadline - loop.time(), 0))
+    for task in pending:
+        # Shared upstream fetches are shielded in the price cache, so they still complete and warm it
+        task.cancel()
+
+    stocks = {}
+    errors = {}
+    for symbol, task in zip(symbols, tasks):
+        if task in pending:
+            errors[symbol] = f"Not fetched within the {deadline_seconds:g}s batch deadline."
+            continue
+        result = task.exception() or task.result()
+        if isinstance(result, HTTPException):
+            errors[symbol] = result.detail
+        elif isinstance(result, Exception):
+            errors[symbol] = f"An unexpected error occurred: {str(result)}"
+        else:
+            stocks[symbol] = result
+    print(f"API Agent (/stock/batch): {len(stocks)} symbols resolved, {len(errors)} failed.")
+    return {"stocks": stocks, "errors": errors}
+
+@app.get("/rate_limit_status")
+async def get_rate_limit_status():
+    """Current AlphaVantage quota usage and queue depth."""
+    return alphavantage_limiter.stats()
+
 @app.get("/stock/{symbol}")
-async def get_stock_data(symbol: str):
+async def get_stock_data(symbol: str, priority: str = "interactive"):
     """
     Fetches the latest closing price and the previous day's closing price for a given stock symbol.
     Example symbols for Asian tech: 'TSM' (TSMC), '005930.KS' (Samsung on KRX), 'BABA' (Alibaba)
     """
     if not ALPHA_VANTAGE_API_KEY:
         raise HTTPException(status_code=500, detail="AlphaVantage API key not configured.")
+    validate_priority(priority)
     try:
-        stock_info = await fetch_stock_data_alphavantage(symbol)
+        stock_info = await get_cached_stock_data(symbol, priority)
         return stock_info
     except HTTPException as e:
         raise e # Re-raise HTTPException to ensure FastAPI handles it correctly
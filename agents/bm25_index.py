@@ -0,0 +1,75 @@
+# /agents/bm25_index.py
+# Incremental inverted-index BM25 store for exact-term matches (tickers, "EPS") that embeddings handle poorly.
+import re
+import math
+import heapq
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+# Keeps dotted/dashed tokens like "005930.KS" or "S-1" together
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9]+(?:[.\-][A-Za-z0-9]+)*")
+RRF_K = 60 # Standard reciprocal-rank-fusion damping constant
+
+
+def tokenize(text: str) -> List[str]:
+    return [token.lower() for token in TOKEN_PATTERN.findall(text)]
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], limit: int) -> List[Tuple[int, float]]:
+    """Fuses ranked ID lists: score(id) = sum over rankings of 1 / (RRF_K + rank)."""
+    scores: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, 1):
+            scores[chunk_id] += 1.0 / (RRF_K + rank)
+    return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+
+class BM25Index:
+    """Okapi BM25 over chunk IDs. Chunks can be added and removed one at a time, matching ChunkStore."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict) # term -> {chunk_id: term frequency}
+        self.doc_terms: Dict[int, List[str]] = {}                     # chunk_id -> distinct terms, for removal
+        self.doc_lengths: Dict[int, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, chunk_id: int, text: str) -> None:
+        term_counts = Counter(tokenize(text))
+        for term, count in term_counts.items():
+            self.postings[term][chunk_id] = count
+        self.doc_terms[chunk_id] = list(term_counts)
+        self.doc_lengths[chunk_id] = sum(term_counts.values())
+        self.total_length += self.doc_lengths[chunk_id]
+
+    def remove(self, chunk_id: int) -> None:
+        for term in self.doc_terms.pop(chunk_id, []):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(chunk_id, 0)
+
+    def search(self, query: str, k: int, allowed_ids: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        """Returns up to k (chunk_id, BM25 score) pairs, best first, restricted to allowed_ids if given."""
+        num_docs = len(self.doc_lengths)
+        if num_docs == 0:
+            return []
+        average_length = self.total_length / num_docs
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, term_frequency in postings.items():
+                if allowed_ids is not None and chunk_id not in allowed_ids:
+                    continue
+                length_norm = 1 - self.b + self.b * self.doc_lengths[chunk_id] / average_length
+                scores[chunk_id] += idf * term_frequency * (self.k1 + 1) / (term_frequency + self.k1 * length_norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
@@ -0,0 +1,147 @@
+# /agents/chunk_docstore.py
+# Compact on-disk chunk store: texts and metadata live in an append-only file, only (offset, length) stays in memory.
+import json
+import threading
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+COMPACTION_GARBAGE_RATIO = 0.5 # Rewrite the file once removed records outweigh live ones
+
+
+class ChunkDocStore:
+    """
+    Chunk records (page_content + metadata) as JSON lines in one file, addressed by byte offset.
+    Chunk IDs are never reused, so a build can append new records while searches keep reading the
+    same file; rewrites (fresh builds, compaction) go to a new file that replaces the old one, and
+    readers that still hold the old file open are unaffected. Records added since the last save or
+    flush() are held in memory until then; long ingests flush periodically so memory stays bounded.
+    """
+
+    def __init__(self):
+        self.offsets: Dict[int, Tuple[int, int]] = {} # chunk_id -> (offset, length) in the file
+        self.pending: Dict[int, Dict[str, Any]] = {}  # Added since the last save
+        self.live_bytes = 0
+        self.garbage_bytes = 0 # Bytes of removed records still in the file
+        self.path: Optional[str] = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Only the offset table is persisted (pickled with the rest of the ChunkStore); the file is reopened on load
+        return {"offsets": self.offsets, "live_bytes": self.live_bytes, "garbage_bytes": self.garbage_bytes}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.offsets = state["offsets"]
+        self.live_bytes = state["live_bytes"]
+        self.garbage_bytes = state["garbage_bytes"]
+
+    def __len__(self) -> int:
+        return len(self.offsets) + len(self.pending)
+
+    def __contains__(self, chunk_id: int) -> bool:
+        return chunk_id in self.pending or chunk_id in self.offsets
+
+    def ids(self) -> Iterator[int]:
+        yield from self.offsets
+        yield from self.pending
+
+    @property
+    def is_open(self) -> bool:
+        return self._file is not None
+
+    def open(self, path: str) -> None:
+        self.close()
+        self.path = path
+        self._file = open(path, "rb")
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def add(self, chunk_id: int, page_content: str, metadata: Dict[str, Any]) -> None:
+        self.pending[chunk_id] = {"page_content": page_content, "metadata": metadata}
+
+    def remove(self, chunk_id: int) -> Optional[Dict[str, Any]]:
+        """Drops a chunk and returns its record. The bytes stay in the file until the next compaction."""
+        chunk = self.pending.pop(chunk_id, None)
+        if chunk is not None:
+            return chunk
+        chunk = self.get(chunk_id)
+        location = self.offsets.pop(chunk_id, None)
+        if location is not None:
+            self.live_bytes -= location[1]
+            self.garbage_bytes += location[1]
+        return chunk
+
+    def get(self, chunk_id: int) -> Optional[Dict[str, Any]]:
+        chunk = self.pending.get(chunk_id)
+        if chunk is not None:
+            return chunk
+        location = self.offsets.get(chunk_id)
+        if location is None or self._file is None:
+            return None
+        with self._lock: # Search threads share one file handle
+            self._file.seek(location[0])
+            record = self._file.read(location[1])
+        return json.loads(record)
+
+    def _write_records(self, f, chunk_ids) -> Dict[int, Tuple[int, int]]:
+        offsets = {}
+        for chunk_id in chunk_ids:
+            record = (json.dumps(self.get(chunk_id), ensure_ascii=False) + "\n").encode("utf-8")
+            offsets[chunk_id] = (f.tell(), len(record))
+            f.write(record)
+        return offsets
+
+    def _append_pending(self) -> None:
+        # A crash mid-append only leaves unreferenced bytes: the saved offset table predates them
+        with open(self.path, "ab") as f:
+            new_offsets = self._write_records(f, list(self.pending))
+        self.offsets.update(new_offsets)
+        self.live_bytes += sum(length for _, length in new_offsets.values())
+        self.pending = {}
+
+    def flush(self, path: str) -> None:
+        """
+        Writes pending records out mid-ingest, before the final save(path). Appends to path when this store
+        already reads from it; a store without a file yet stages its records in path + ".tmp", which save() then
+        hands back to be moved into place. Records of a store reading some other file stay pending until save().
+        """
+        if not self.pending:
+            return
+        if self._file is None:
+            if self.offsets:
+                return
+            self.path = path + ".tmp"
+            open(self.path, "wb").close() # Drops a leftover from an interrupted build
+            self._file = open(self.path, "rb")
+        if self.path not in (path, path + ".tmp"):
+            return
+        self._append_pending()
+
+    def save(self, path: str) -> Optional[str]:
+        """
+        Persists pending records to path. Appends when this store already reads from path; otherwise
+        (or when compaction is due) writes path + ".tmp" and returns that name for the caller to move into place.
+        A store staged by flush() finishes its staging file and returns it without copying.
+        """
+        if self.path == path + ".tmp" and self._file is not None:
+            self._append_pending()
+            self.path = path # The open handle follows the file once the caller renames it
+            return path + ".tmp"
+        rewrite = (self.path != path or self._file is None
+                   or self.garbage_bytes > COMPACTION_GARBAGE_RATIO * max(self.live_bytes, 1))
+        if not rewrite:
+            if self.pending:
+                self._append_pending()
+            return None
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            new_offsets = self._write_records(f, list(self.ids()))
+        self.offsets, self.pending = new_offsets, {}
+        self.live_bytes = sum(length for _, length in new_offsets.values())
+        self.garbage_bytes = 0
+        self.close() # Old offsets are gone; reads switch to the new file once the caller has moved it into place
+        self.path = path
+        return tmp_path
@@ -0,0 +1,314 @@
+# /agents/chunk_store.py
+# FAISS vectors keyed by stable chunk IDs, plus an on-disk chunk docstore and a per-file manifest for incremental indexing.
+import os
+import json
+import math
+import time
+import pickle
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
+import faiss
+from bm25_index import BM25Index
+from document_metadata import MetadataIndex
+from chunk_docstore import ChunkDocStore
+
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.pkl"    # Manifest, offset table, BM25 and metadata indexes
+DOCSTORE_FILE = "chunks.jsonl" # Chunk texts + metadata, read lazily per hit
+MANIFEST_FILE = "manifest.json"
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+# How stored vectors are encoded: full float32, scalar-quantized fp16 (2x smaller) / int8 (4x), or PQ (pq_m bytes)
+VECTOR_ENCODINGS = ("float32", "fp16", "int8", "pq")
+DEFAULT_INDEX_CONFIG = {
+    "index_type": "flat",
+    "vector_encoding": "float32",
+    "nlist": 0,                  # IVF lists; 0 = 4 * sqrt(num_vectors)
+    "pq_m": 48,                  # PQ sub-quantizers; must divide the embedding dimension
+    "hnsw_m": 32,                # HNSW graph degree
+    "train_sample_size": 100000, # Vectors buffered to train IVF/PQ/SQ8 (nlist=0 is sized from these); later ones are added directly
+    "nprobe": 8,                 # IVF lists visited per query
+    "ef_search": 64,             # HNSW candidate list size per query
+}
+MIN_POINTS_PER_CENTROID = 39 # Below this k-means training is unreliable (FAISS warns)
+PQ_CENTROIDS = 256
+
+
+def choose_vector_codec(config: Dict[str, Any], num_vectors: int, dimension: int) -> str:
+    """FAISS code string for the configured vector encoding; "ivf_pq" always uses PQ codes."""
+    encoding = "pq" if config["index_type"] == "ivf_pq" else config["vector_encoding"]
+    if encoding == "pq":
+        pq_m = config["pq_m"]
+        if dimension % pq_m != 0:
+            pq_m = max(m for m in range(1, pq_m + 1) if dimension % m == 0)
+        if num_vectors >= PQ_CENTROIDS * MIN_POINTS_PER_CENTROID:
+            return f"PQ{pq_m}"
+        print(f"ChunkStore: Only {num_vectors} vectors, too few to train PQ. Storing full float32 vectors.")
+        return "Flat"
+    return {"fp16": "SQfp16", "int8": "SQ8"}.get(encoding, "Flat")
+
+
+def choose_index_factory(config: Dict[str, Any], num_vectors: int, dimension: int) -> str:
+    """
+    Picks the FAISS factory string for the configured index type and vector encoding, falling
+    back to simpler indexes when there are too few vectors to train it.
+    """
+    index_type = config["index_type"]
+    codec = choose_vector_codec(config, num_vectors, dimension)
+    if index_type == "hnsw":
+        return f"HNSW{config['hnsw_m']}" + ("" if codec == "Flat" else f",{codec}")
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = config["nlist"] or int(4 * math.sqrt(num_vectors))
+        nlist = min(nlist, num_vectors // MIN_POINTS_PER_CENTROID)
+        if nlist < 2:
+            print(f"ChunkStore: Only {num_vectors} vectors, too few to train '{index_type}'. Using a flat index.")
+            return codec
+        return f"IVF{nlist},{codec}"
+    return codec
+
+
+class ChunkStore:
+    """
+    Keeps every chunk's ID across updates: re-indexing a changed file only removes that file's vectors
+    and adds the new ones, nothing else is re-embedded. IVF indexes store the chunk IDs natively; flat
+    and HNSW ones are wrapped in an IndexIDMap2.
+    `files` maps each source path to {"sha256", "size", "mtime_ns", "chunk_ids"}. Chunk texts live
+    in `docstore` on disk; only the top-k hits of a search are ever read back.
+    """
+
+    def __init__(self, settings_key: str, index_config: Optional[Dict[str, Any]] = None):
+        self.settings_key = settings_key # Embedding model, chunking and index settings; a mismatch forces a full rebuild
+        self.index_config = {**DEFAULT_INDEX_CONFIG, **(index_config or {})}
+        self.index: Optional[faiss.Index] = None
+        self.index_description = None # Factory string actually built, e.g. "IVF256,PQ48"
+        self.docstore = ChunkDocStore()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.next_id = 0
+        self.memory_mapped = False
+        self.bm25 = BM25Index() # Lexical index over the same chunks, kept in step with the vectors
+        self.metadata_index = MetadataIndex() # Source/ticker/region/date -> chunk IDs, for filtered search
+        # Vectors added before the index exists; trainable indexes buffer at most train_sample_size of them
+        self._pending_ids: List[np.ndarray] = []
+        self._pending_vectors: List[np.ndarray] = []
+        self._pending_count = 0
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal if self.index is not None else 0
+
+    @property
+    def supports_removal(self) -> bool:
+        """HNSW graphs can't delete vectors; changing or removing files then needs a rebuild."""
+        return not (self.index_description or "").startswith("HNSW")
+
+    @property
+    def needs_training(self) -> bool:
+        return (self.index_config["index_type"] in ("ivf_flat", "ivf_pq")
+                or self.index_config["vector_encoding"] in ("int8", "pq"))
+
+    def _add_vectors(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """
+        Untrained index types are created on the first batch and filled as files arrive. Trainable ones
+        buffer vectors until train_sample_size is reached, then train on that buffer and add the rest
+        directly, so ingest memory doesn't grow with the corpus.
+        """
+        self._pending_ids.append(ids)
+        self._pending_vectors.append(vectors)
+        self._pending_count += len(ids)
+        if self.index is not None or not self.needs_training or self._pending_count >= self.index_config["train_sample_size"]:
+            self.finalize()
+
+    def finalize(self) -> None:
+        """Builds (and trains, if needed) the index from the buffered vectors, or adds them to it. Call before search/save."""
+        if not self._pending_vectors:
+            return
+        ids = np.concatenate(self._pending_ids)
+        vectors = np.concatenate(self._pending_vectors)
+        self._pending_ids, self._pending_vectors, self._pending_count = [], [], 0
+        if self.index is not None:
+            self.index.add_with_ids(vectors, ids)
+            return
+        self.index_description = choose_index_factory(self.index_config, len(vectors), vectors.shape[1])
+        # IndexIVF.remove_ids keeps its stored IDs while IDMap2 would compact its id_map regardless, so
+        # after a removal the two disagree; IVF needs no ID map anyway, it stores the user IDs itself
+        is_ivf = self.index_description.startswith("IVF")
+        index = faiss.index_factory(vectors.shape[1], self.index_description if is_ivf else f"IDMap2,{self.index_description}")
+        if not index.is_trained:
+            sample_size = min(len(vectors), self.index_config["train_sample_size"])
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), sample_size, replace=False)]
+            started = time.perf_counter()
+            index.train(sample)
+            print(f"ChunkStore: Trained {self.index_description} on {sample_size} vectors in {time.perf_counter() - started:.1f}s.")
+        index.add_with_ids(vectors, ids)
+        self.index = index
+
+    def add_file_chunks(self, source: str, file_info: Dict[str, Any], texts: List[str],
+                        metadatas: List[Dict[str, Any]], vectors: np.ndarray) -> List[int]:
+        """Adds the chunks of one source file. Any chunks previously indexed for it must be removed first."""
+        chunk_ids = list(range(self.next_id, self.next_id + len(texts)))
+        self.next_id += len(texts)
+        if texts:
+            self._add_vectors(np.array(chunk_ids, dtype="int64"), np.ascontiguousarray(vectors, dtype="float32"))
+            for chunk_id, text, metadata in zip(chunk_ids, texts, metadatas):
+                self.docstore.add(chunk_id, text, metadata)
+                self.bm25.add(chunk_id, text)
+                self.metadata_index.add(chunk_id, source, metadata)
+        self.files[source] = {**file_info, "chunk_ids": chunk_ids}
+        return chunk_ids
+
+    def remove_file(self, source: str) -> int:
+        file_entry = self.files.pop(source, None)
+        if not file_entry or not file_entry["chunk_ids"]:
+            return 0
+        self.finalize()
+        removed = self.index.remove_ids(np.array(file_entry["chunk_ids"], dtype="int64"))
+        for chunk_id in file_entry["chunk_ids"]:
+            chunk = self.docstore.remove(chunk_id)
+            self.bm25.remove(chunk_id)
+            if chunk is not None:
+                self.metadata_index.remove(chunk_id, source, chunk["metadata"])
+        return int(removed)
+
+    def _search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None, selector=None):
+        index = faiss.downcast_index(self.index)
+        inner_index = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+        if faiss.try_extract_index_ivf(inner_index) is not None:
+            return faiss.SearchParametersIVF(nprobe=nprobe or self.index_config["nprobe"], sel=selector)
+        if isinstance(inner_index, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(efSearch=ef_search or self.index_config["ef_search"], sel=selector)
+        return faiss.SearchParameters(sel=selector) if selector is not None else None
+
+    def filter_ids(self, filters: Optional[Dict[str, Any]]) -> Optional[Set[int]]:
+        """Chunk IDs allowed by a filter dict (see MetadataIndex.select), or None for no restriction."""
+        return self.metadata_index.select(**filters) if filters else None
+
+    def search(self, query_vectors: np.ndarray, k: int, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+               allowed_ids: Optional[Set[int]] = None) -> List[List[Tuple[int, float]]]:
+        """
+        Returns, per query row, up to k (chunk_id, L2 distance) pairs, nearest first. With allowed_ids,
+        FAISS skips every other vector during the scan instead of the caller post-filtering the hits.
+        """
+        if self.ntotal == 0 or (allowed_ids is not None and not allowed_ids):
+            return [[] for _ in range(len(query_vectors))]
+        selector = None
+        if allowed_ids is not None:
+            selector = faiss.IDSelectorBatch(np.fromiter(allowed_ids, dtype="int64", count=len(allowed_ids)))
+        distances, ids = self.index.search(
+            np.ascontiguousarray(query_vectors, dtype="float32"), k,
+            params=self._search_params(nprobe, ef_search, selector)
+        )
+        return [
+            [(int(chunk_id), float(distance)) for chunk_id, distance in zip(id_row, distance_row) if chunk_id != -1]
+            for id_row, distance_row in zip(ids, distances)
+        ]
+
+    def lexical_search(self, query: str, k: int, allowed_ids: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        return self.bm25.search(query, k, allowed_ids)
+
+    def get_chunk(self, chunk_id: int) -> Optional[Dict[str, Any]]:
+        return self.docstore.get(chunk_id)
+
+    def chunk_ids(self) -> List[int]:
+        return list(self.docstore.ids())
+
+    def snapshot(self) -> "ChunkStore":
+        # Same interface as ShardedChunkStore.snapshot(); chunk IDs are never reused within a store, so it is its own view
+        return self
+
+    def evaluate_recall(self, query_vectors: np.ndarray, exact_ids: np.ndarray, exact_vectors: np.ndarray, k: int,
+                        nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> Dict[str, Any]:
+        """Recall@k of this index against an exact flat search over exact_vectors (keyed by exact_ids)."""
+        exact_index = faiss.IndexIDMap2(faiss.IndexFlatL2(exact_vectors.shape[1]))
+        exact_index.add_with_ids(np.ascontiguousarray(exact_vectors, dtype="float32"), exact_ids.astype("int64"))
+        started = time.perf_counter()
+        _, expected = exact_index.search(np.ascontiguousarray(query_vectors, dtype="float32"), k)
+        exact_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        approximate = self.search(query_vectors, k, nprobe=nprobe, ef_search=ef_search)
+        approximate_seconds = time.perf_counter() - started
+        recalls = []
+        for expected_row, hits in zip(expected, approximate):
+            expected_set = {int(chunk_id) for chunk_id in expected_row if chunk_id != -1}
+            if expected_set:
+                recalls.append(len(expected_set & {chunk_id for chunk_id, _ in hits}) / len(expected_set))
+        return {
+            "k": k,
+            "num_queries": len(query_vectors),
+            "recall_at_k": round(float(np.mean(recalls)), 4) if recalls else None,
+            "index_description": self.index_description,
+            "nprobe": nprobe or self.index_config["nprobe"],
+            "ef_search": ef_search or self.index_config["ef_search"],
+            "exact_ms_per_query": round(exact_seconds * 1000 / max(len(query_vectors), 1), 3),
+            "index_ms_per_query": round(approximate_seconds * 1000 / max(len(query_vectors), 1), 3),
+        }
+
+    def flush(self, index_dir: str) -> None:
+        """Writes chunk records added so far to the docstore file in index_dir, so a long ingest doesn't hold them all in memory."""
+        os.makedirs(index_dir, exist_ok=True)
+        self.docstore.flush(os.path.join(index_dir, DOCSTORE_FILE))
+
+    def save(self, index_dir: str) -> None:
+        self.finalize()
+        os.makedirs(index_dir, exist_ok=True)
+        # Write to temp files first so a crash mid-save never leaves a half-written index behind
+        written = []
+        if self.index is not None:
+            faiss.write_index(self.index, os.path.join(index_dir, INDEX_FILE + ".tmp"))
+            written.append(INDEX_FILE)
+        # New records are appended in place (their offsets are only referenced once the pickle below lands)
+        if self.docstore.save(os.path.join(index_dir, DOCSTORE_FILE)):
+            written.append(DOCSTORE_FILE)
+        with open(os.path.join(index_dir, CHUNKS_FILE + ".tmp"), "wb") as f:
+            pickle.dump({"docstore": self.docstore, "files": self.files, "next_id": self.next_id, "bm25": self.bm25,
+                         "metadata_index": self.metadata_index}, f)
+        with open(os.path.join(index_dir, MANIFEST_FILE + ".tmp"), "w", encoding="utf-8") as f:
+            json.dump({
+                "settings_key": self.settings_key,
+                "index_description": self.index_description,
+                "vector_encoding": self.index_config["vector_encoding"],
+                "num_vectors": self.ntotal,
+                "num_files": len(self.files),
+                "saved_at": datetime.utcnow().isoformat()
+            }, f)
+        written += [CHUNKS_FILE, MANIFEST_FILE]
+        for file_name in written:
+            os.replace(os.path.join(index_dir, file_name + ".tmp"), os.path.join(index_dir, file_name))
+        if not self.docstore.is_open:
+            self.docstore.open(os.path.join(index_dir, DOCSTORE_FILE))
+        if self.index is None and os.path.exists(os.path.join(index_dir, INDEX_FILE)):
+            os.remove(os.path.join(index_dir, INDEX_FILE))
+
+    @classmethod
+    def load(cls, index_dir: str, settings_key: str, memory_map: bool = True,
+             index_config: Optional[Dict[str, Any]] = None) -> Optional["ChunkStore"]:
+        """Loads a saved store built with the same settings, or returns None. Memory-mapped stores are read-only."""
+        manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("settings_key") != settings_key:
+            print("ChunkStore: Persisted index was built with different settings, ignoring it.")
+            return None
+        store = cls(settings_key, index_config)
+        store.index_description = manifest.get("index_description")
+        index_path = os.path.join(index_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            store.index = None
+            if memory_map:
+                try:
+                    store.index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+                    store.memory_mapped = True
+                except RuntimeError:
+                    pass # Index type without mmap support, read into memory below
+            if store.index is None:
+                store.index = faiss.read_index(index_path)
+        with open(os.path.join(index_dir, CHUNKS_FILE), "rb") as f:
+            saved = pickle.load(f)
+        store.files, store.next_id = saved["files"], saved["next_id"]
+        store.docstore = saved["docstore"]
+        store.docstore.open(os.path.join(index_dir, DOCSTORE_FILE))
+        store.bm25 = saved["bm25"]
+        store.metadata_index = saved["metadata_index"]
+        return store
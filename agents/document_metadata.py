@@ -0,0 +1,144 @@
+# /agents/document_metadata.py
+# Derives filterable metadata (date, tickers, regions) from research documents at ingest time, and the
+# per-attribute chunk-ID index that /search filters are resolved against.
+import re
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+# Bump when extraction changes so persisted chunks get re-tagged
+METADATA_VERSION = 1
+
+HEADER_CHARS = 1000 # Dates are taken from the headline/dateline only
+
+MONTHS = "January|February|March|April|May|June|July|August|September|October|November|December"
+FULL_DATE_PATTERN = re.compile(rf"\b({MONTHS})\s+(\d{{1,2}}),\s+(\d{{4}})\b")
+MONTH_YEAR_PATTERN = re.compile(rf"\b({MONTHS})\s+(\d{{4}})\b")
+QUARTER_PATTERN = re.compile(r"\bQ([1-4])\s+(\d{4})\b")
+ISO_DATE_PATTERN = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+
+EXCHANGE_TICKER_PATTERN = re.compile(r"\((?:NYSE|NASDAQ|KRX|KOSPI|TWSE|TSE|HKEX|LSE)\s*:\s*([A-Z0-9.]+)\)")
+KRX_TICKER_PATTERN = re.compile(r"\b\d{6}\.K[SQ]\b")
+TICKER_ALIASES = {
+    "TSMC": "TSM", "Taiwan Semiconductor": "TSM",
+    "Samsung": "005930.KS",
+    "Apple": "AAPL", "Microsoft": "MSFT", "Nvidia": "NVDA", "NVIDIA": "NVDA",
+    "Alibaba": "BABA", "Tencent": "TCEHY", "Sony": "SONY", "Toyota": "TM", "SoftBank": "SFTBY",
+    "Infosys": "INFY", "Intel": "INTC", "Micron": "MU", "Qualcomm": "QCOM", "ASML": "ASML",
+}
+REGION_KEYWORDS = {
+    "Asia": ["Asia", "Asian", "Taiwan", "South Korea", "Korea", "Seoul", "Hsinchu", "Japan", "Tokyo",
+             "China", "Hong Kong", "Singapore", "India"],
+    "North America": ["United States", "U.S.", "Wall Street", "Canada", "Silicon Valley"],
+    "Europe": ["Europe", "European", "Germany", "France", "United Kingdom", "U.K.", "Netherlands"],
+    "Emerging Markets": ["emerging market", "Emerging Market", "Brazil", "Mexico", "Indonesia"],
+}
+REGION_PATTERNS = {
+    region: re.compile(r"(?<![A-Za-z])(?:" + "|".join(re.escape(keyword) for keyword in keywords) + r")(?![A-Za-z])")
+    for region, keywords in REGION_KEYWORDS.items()
+}
+TICKER_ALIAS_PATTERN = re.compile(r"\b(" + "|".join(re.escape(alias) for alias in TICKER_ALIASES) + r")\b")
+
+
+def extract_document_date(text: str) -> Optional[str]:
+    """ISO date of the first dateline in the header; month/quarter mentions map to the period start."""
+    header = text[:HEADER_CHARS]
+    match = ISO_DATE_PATTERN.search(header)
+    if match:
+        return match.group(0)
+    match = FULL_DATE_PATTERN.search(header)
+    if match:
+        return datetime.strptime(f"{match.group(1)} {match.group(2)} {match.group(3)}", "%B %d %Y").date().isoformat()
+    match = MONTH_YEAR_PATTERN.search(header)
+    if match:
+        return datetime.strptime(f"{match.group(1)} {match.group(2)}", "%B %Y").date().isoformat()
+    match = QUARTER_PATTERN.search(header)
+    if match:
+        return f"{match.group(2)}-{(int(match.group(1)) - 1) * 3 + 1:02d}-01"
+    return None
+
+
+def extract_tickers(text: str) -> List[str]:
+    tickers = set(EXCHANGE_TICKER_PATTERN.findall(text))
+    tickers.update(KRX_TICKER_PATTERN.findall(text))
+    tickers.update(TICKER_ALIASES[alias] for alias in TICKER_ALIAS_PATTERN.findall(text))
+    return sorted(tickers)
+
+
+def extract_regions(text: str) -> List[str]:
+    return sorted(region for region, pattern in REGION_PATTERNS.items() if pattern.search(text))
+
+
+def extract_document_metadata(text: str) -> Dict[str, Any]:
+    return {
+        "date": extract_document_date(text),
+        "tickers": extract_tickers(text),
+        "regions": extract_regions(text),
+    }
+
+
+class MetadataIndex:
+    """
+    Inverted index from attribute value to the set of chunk IDs carrying it (source, ticker, region,
+    date). A filter resolves to the allowed ID subset before any vector or BM25 scoring happens.
+    Ticker and region values are matched case-insensitively.
+    """
+
+    def __init__(self):
+        self.by_source: Dict[str, Set[int]] = defaultdict(set)
+        self.by_ticker: Dict[str, Set[int]] = defaultdict(set)
+        self.by_region: Dict[str, Set[int]] = defaultdict(set)
+        self.by_date: Dict[str, Set[int]] = defaultdict(set) # ISO date -> IDs; few distinct dates per corpus
+
+    def _postings(self, metadata: Dict[str, Any], source: str):
+        yield self.by_source, source
+        for ticker in metadata.get("tickers") or []:
+            yield self.by_ticker, ticker.upper()
+        for region in metadata.get("regions") or []:
+            yield self.by_region, region.lower()
+        if metadata.get("date"):
+            yield self.by_date, metadata["date"]
+
+    def add(self, chunk_id: int, source: str, metadata: Dict[str, Any]) -> None:
+        for postings, value in self._postings(metadata, source):
+            postings[value].add(chunk_id)
+
+    def remove(self, chunk_id: int, source: str, metadata: Dict[str, Any]) -> None:
+        for postings, value in self._postings(metadata, source):
+            ids = postings.get(value)
+            if ids is not None:
+                ids.discard(chunk_id)
+                if not ids:
+                    del postings[value]
+
+    @staticmethod
+    def _union(postings: Dict[str, Set[int]], values: Iterable[str]) -> Set[int]:
+        allowed: Set[int] = set()
+        for value in values:
+            allowed |= postings.get(value, set())
+        return allowed
+
+    def select(self, sources: Optional[List[str]] = None, tickers: Optional[List[str]] = None,
+               regions: Optional[List[str]] = None, date_from: Optional[Any] = None,
+               date_to: Optional[Any] = None) -> Optional[Set[int]]:
+        """
+        IDs matching every given attribute (any of the listed values within one attribute; dates are
+        inclusive ISO bounds). Returns None when no filter is set, i.e. the whole corpus is allowed.
+        """
+        candidate_sets = []
+        if sources:
+            candidate_sets.append(self._union(self.by_source, sources))
+        if tickers:
+            candidate_sets.append(self._union(self.by_ticker, [ticker.upper() for ticker in tickers]))
+        if regions:
+            candidate_sets.append(self._union(self.by_region, [region.lower() for region in regions]))
+        if date_from or date_to:
+            low, high = str(date_from or ""), str(date_to or "9999-12-31")
+            candidate_sets.append(self._union(self.by_date, [day for day in self.by_date if low <= day <= high]))
+        if not candidate_sets:
+            return None
+        candidate_sets.sort(key=len) # Intersect starting from the most selective attribute
+        allowed = set(candidate_sets[0])
+        for ids in candidate_sets[1:]:
+            allowed &= ids
+        return allowed
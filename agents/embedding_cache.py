@@ -0,0 +1,115 @@
+# /agents/embedding_cache.py
+# Content-addressed embedding cache: chunk vectors on disk (SQLite), query vectors in an in-memory LRU.
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+
+
+class CachedEmbeddings:
+    """
+    Drop-in wrapper around a LangChain embeddings object (embed_documents / embed_query).
+    Entries are keyed by sha256(model name + text), so identical chunks are never re-embedded
+    across rebuilds and repeated queries skip the forward pass entirely.
+    """
+
+    def __init__(self, embeddings, model_name: str, cache_path: Optional[str] = None, query_cache_size: int = 1024):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.query_cache_size = query_cache_size
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+        if cache_path:
+            try:
+                self._db = sqlite3.connect(cache_path, check_same_thread=False)
+                self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+                self._db.commit()
+            except Exception as e:
+                print(f"EmbeddingCache: Could not open {cache_path}, chunk embeddings will not be cached: {e}")
+                self._db = None
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _read_vectors(self, keys: List[str]) -> Dict[str, List[float]]:
+        if self._db is None or not keys:
+            return {}
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500): # Stay under SQLite's bound-parameter limit
+                batch = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype="float32").tolist()
+        return found
+
+    def _write_vectors(self, vectors_by_key: Dict[str, List[float]]) -> None:
+        if self._db is None or not vectors_by_key:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype="float32").tobytes()) for key, vector in vectors_by_key.items()]
+            )
+            self._db.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        cached = self._read_vectors(list(dict.fromkeys(keys)))
+        # Embed each distinct missing text once, in a single batched call
+        missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+        if missing:
+            new_vectors = dict(zip(missing.keys(), self.embeddings.embed_documents(list(missing.values()))))
+            self._write_vectors(new_vectors)
+            cached.update(new_vectors)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        with self._lock:
+            vector = self._query_cache.get(key)
+            if vector is not None:
+                self._query_cache.move_to_end(key)
+                self.hits += 1
+                return vector
+        vector = self.embeddings.embed_query(text)
+        with self._lock:
+            self.misses += 1
+            self._query_cache[key] = vector
+            if len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Like embed_query for many queries: LRU hits are reused, all misses share one batched forward pass."""
+        keys = [self._key(text) for text in texts]
+        vectors: Dict[str, List[float]] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._query_cache.get(key)
+                if vector is not None:
+                    self._query_cache.move_to_end(key)
+                    vectors[key] = vector
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            vectors.update(zip(missing.keys(), self.embeddings.embed_documents(list(missing.values()))))
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+            for key in missing:
+                self._query_cache[key] = vectors[key]
+                if len(self._query_cache) > self.query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return [vectors[key] for key in keys]
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "cached_queries": len(self._query_cache)}
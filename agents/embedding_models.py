@@ -0,0 +1,59 @@
+# /agents/embedding_models.py
+# Process-wide registry so each sentence-transformer (embedding or cross-encoder) is loaded from disk once and shared.
+import time
+import threading
+from typing import Any, Callable, Dict
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+MODEL_NOT_LOADED = "not_loaded"
+MODEL_LOADING = "loading"
+MODEL_READY = "ready"
+MODEL_FAILED = "failed"
+
+_models: Dict[str, Any] = {}
+_status: Dict[str, str] = {}
+_lock = threading.Lock()
+
+
+def _get_or_load(model_name: str, load: Callable[[], Any]) -> Any:
+    """Returns the shared model, loading it on first use. Concurrent callers wait for the single load."""
+    model = _models.get(model_name)
+    if model is not None:
+        return model
+    with _lock:
+        if model_name not in _models:
+            _status[model_name] = MODEL_LOADING
+            started = time.perf_counter()
+            try:
+                _models[model_name] = load()
+            except Exception:
+                _status[model_name] = MODEL_FAILED
+                raise
+            _status[model_name] = MODEL_READY
+            print(f"EmbeddingModels: Loaded '{model_name}' in {time.perf_counter() - started:.1f}s.")
+        return _models[model_name]
+
+
+def get_embedding_model(model_name: str) -> HuggingFaceEmbeddings:
+    return _get_or_load(model_name, lambda: HuggingFaceEmbeddings(model_name=model_name))
+
+
+def get_cross_encoder(model_name: str):
+    """Shared sentence-transformers CrossEncoder, used by the retriever's optional rerank stage."""
+    def load():
+        from sentence_transformers import CrossEncoder # Only needed when reranking is used
+        return CrossEncoder(model_name)
+    return _get_or_load(model_name, load)
+
+
+def warmup_embedding_model(model_name: str) -> None:
+    """Loads the model and runs one encode so the first real request doesn't pay for lazy init."""
+    get_embedding_model(model_name).embed_query("warmup")
+
+
+def warmup_cross_encoder(model_name: str) -> None:
+    get_cross_encoder(model_name).predict([("warmup", "warmup")])
+
+
+def embedding_model_status(model_name: str) -> str:
+    return _status.get(model_name, MODEL_NOT_LOADED)
@@ -0,0 +1,68 @@
+# /agents/http_clients.py
+# Shared, pooled httpx clients for every upstream host the agents talk to.
+# Clients are created lazily, reused across requests (keep-alive) and closed on app shutdown.
+import os
+import asyncio
+import httpx
+from typing import Dict
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_DEFAULT_TIMEOUT = float(os.getenv("HTTP_DEFAULT_TIMEOUT", "30"))
+
+try:
+    import h2 # noqa: F401 -- only needed so httpx can negotiate HTTP/2
+    HTTP2_AVAILABLE = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+class TimeoutASGITransport(httpx.ASGITransport):
+    """
+    ASGITransport ignores the per-request `timeout=`, so a hung in-process app would block its caller forever.
+    This enforces the request's read timeout over the whole call and raises httpx.ReadTimeout, as a network client would.
+    """
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        timeout = request.extensions.get("timeout", {}).get("read")
+        if timeout is None:
+            return await super().handle_async_request(request)
+        try:
+            return await asyncio.wait_for(super().handle_async_request(request), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise httpx.ReadTimeout(f"In-process request to {request.url.path} timed out after {timeout:g}s", request=request)
+
+
+def get_http_client(name: str, **client_kwargs) -> httpx.AsyncClient:
+    """
+    Returns the pooled client registered under `name` (one per upstream host, e.g. "alphavantage"),
+    creating it on first use. client_kwargs only apply when the client is created.
+    Callers must not close the returned client; use close_http_clients() on shutdown.
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client_kwargs.setdefault("timeout", HTTP_DEFAULT_TIMEOUT)
+        client_kwargs.setdefault("limits", httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ))
+        # ASGI transports don't speak HTTP/2, only enable it for network clients
+        if "transport" not in client_kwargs:
+            client_kwargs.setdefault("http2", HTTP2_AVAILABLE)
+        client = httpx.AsyncClient(**client_kwargs)
+        _clients[name] = client
+        print(f"HTTP Clients: Created pooled client '{name}' (http2={client_kwargs.get('http2', False)}).")
+    return client
+
+
+async def close_http_clients() -> None:
+    for name, client in list(_clients.items()):
+        try:
+            await client.aclose()
+        except Exception as e:
+            print(f"HTTP Clients: Error closing client '{name}': {e}")
+    _clients.clear()
@@ -0,0 +1,110 @@
+# /agents/ingest_pipeline.py
+# Streaming ingest for the retriever: parse files in a process pool, embed chunks in fixed-size batches.
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import TextLoader
+from document_metadata import extract_document_metadata
+
+
+def parse_file(path: str, chunk_size: int, chunk_overlap: int) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Loads and splits one file into (texts, metadatas). Runs in a worker process, so it must stay picklable."""
+    documents = TextLoader(path).load()
+    for document in documents: # Document-level date/tickers/regions are inherited by every chunk
+        document.metadata.update(extract_document_metadata(document.page_content))
+    chunks = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap).split_documents(documents)
+    return [chunk.page_content for chunk in chunks], [chunk.metadata for chunk in chunks]
+
+
+def iter_parsed_files(items: List[Tuple[str, Any, Dict[str, Any]]], chunk_size: int, chunk_overlap: int,
+                      workers: int, prefetch: int) -> Iterator[Tuple[Tuple[str, Any, Dict[str, Any]], List[str], List[Dict[str, Any]]]]:
+    """
+    Yields (item, texts, metadatas) for each (source, path, file_info) item, in order. With workers > 1
+    parsing runs in a process pool, but at most `prefetch` files are parsed ahead of the consumer, so
+    memory stays bounded however large the corpus is.
+    """
+    if workers <= 1 or len(items) <= 1:
+        for item in items:
+            yield (item, *parse_file(str(item[1]), chunk_size, chunk_overlap))
+        return
+    # Spawned, not forked: a fork would copy the retriever's loaded model, thread pools and locks into every worker
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        in_flight = deque()
+        remaining = iter(items)
+        for item in remaining:
+            in_flight.append((item, executor.submit(parse_file, str(item[1]), chunk_size, chunk_overlap)))
+            if len(in_flight) >= prefetch:
+                break
+        while in_flight:
+            item, future = in_flight.popleft()
+            texts, metadatas = future.result()
+            next_item = next(remaining, None)
+            if next_item is not None:
+                in_flight.append((next_item, executor.submit(parse_file, str(next_item[1]), chunk_size, chunk_overlap)))
+            yield item, texts, metadatas
+
+
+def embed_in_batches(parsed_files: Iterable[Tuple[Any, List[str], List[Dict[str, Any]]]],
+                     embed_documents: Callable[[List[str]], List[List[float]]],
+                     batch_size: int) -> Iterator[Tuple[Any, List[str], List[Dict[str, Any]], np.ndarray]]:
+    """
+    Yields (item, texts, metadatas, vectors) per file. Chunks are embedded in forward passes of
+    batch_size texts that span file boundaries, so many small files don't each pay for a tiny batch;
+    a file is yielded as soon as its last chunk has been embedded.
+    """
+    waiting = deque() # Files with chunks still to embed, in order: [item, texts, metadatas, vectors]
+    batch: List[str] = []
+
+    def flush():
+        vectors = embed_documents(batch) if batch else []
+        batch.clear()
+        position = 0
+        for entry in waiting: # Batches are filled in file order, so vectors are handed out the same way
+            if position == len(vectors):
+                break
+            needed = len(entry[1]) - len(entry[3])
+            entry[3].extend(vectors[position:position + needed])
+            position += min(needed, len(vectors) - position)
+
+    def completed():
+        while waiting and len(waiting[0][3]) == len(waiting[0][1]):
+            item, texts, metadatas, vectors = waiting.popleft()
+            yield item, texts, metadatas, np.array(vectors, dtype="float32") if vectors else np.empty((0, 0), dtype="float32")
+
+    for item, texts, metadatas in parsed_files:
+        waiting.append([item, texts, metadatas, []])
+        for text in texts:
+            batch.append(text)
+            if len(batch) >= batch_size:
+                flush()
+        yield from completed()
+    flush()
+    yield from completed()
+
+
+class IngestProgress:
+    """Counters for a running ingest, exposed on the build job so /status can show throughput."""
+
+    def __init__(self, files_total: int):
+        self.files_total = files_total
+        self.files_done = 0
+        self.chunks_done = 0
+        self.started = time.perf_counter()
+
+    def file_done(self, num_chunks: int) -> None:
+        self.files_done += 1
+        self.chunks_done += num_chunks
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "files_done": self.files_done,
+            "files_total": self.files_total,
+            "chunks_done": self.chunks_done,
+            "elapsed_seconds": round(elapsed, 1),
+            "chunks_per_second": round(self.chunks_done / elapsed, 1) if elapsed > 0 else None,
+        }
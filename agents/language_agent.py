@@ -1,10 +1,20 @@
 import os
+import json
+import time
+import asyncio
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage # AIMessage for assistant history
 from dotenv import load_dotenv
-from typing import List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
+from portfolio_summary import MAX_FOCUS_HOLDINGS, compact_summary, parse_portfolio_csv, summarize_portfolio
+from prompt_budget import MESSAGE_OVERHEAD_TOKENS, count_tokens, fit_chat_history, fit_items, load_encoding
+from response_cache import ResponseCache, context_fingerprint
+from embedding_cache import CachedEmbeddings
+from embedding_models import get_embedding_model, embedding_model_status, warmup_embedding_model, MODEL_READY
+from worker_pools import BoundedExecutor, PoolSaturated
 
 load_dotenv()
 
@@ -14,6 +24,54 @@ llm = None
 # MODEL_NAME IS SET AS PER YOUR REQUEST
 MODEL_NAME = "gemini-2.0-flash-lite"
 
+# LLM calls are awaited (ainvoke) so they never block the event loop shared by every mounted agent.
+# At most LLM_MAX_CONCURRENCY run at once; the timeouts include time spent waiting for a slot.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+KEYWORDS_TIMEOUT_SECONDS = float(os.getenv("LLM_KEYWORDS_TIMEOUT_SECONDS", "15"))
+SYNTHESIS_TIMEOUT_SECONDS = float(os.getenv("LLM_SYNTHESIS_TIMEOUT_SECONDS", "45"))
+llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+# Synthesis prompts are kept within LLM_PROMPT_TOKEN_BUDGET (counted locally, see prompt_budget.py).
+# Context sections are filled in this order (so the portfolio and RAG context outrank history), each
+# holding back up to its share of what the fixed instructions leave for the sections after it.
+PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "8000"))
+PROMPT_SECTION_SHARES = {"portfolio": 0.3, "rag": 0.35, "news": 0.2, "history": 0.15}
+NEWS_HEADER = "Recent News Summaries (use for current events/sentiment):"
+
+# Synthesized narratives are cached per (normalized query, context fingerprint) so repeated questions
+# about unchanged data skip the LLM. LLM_RESPONSE_CACHE_SIZE=0 disables the cache. A similarity
+# threshold (e.g. 0.92) also matches rephrased queries by embedding; it is off by default.
+RESPONSE_CACHE_SIZE = int(os.getenv("LLM_RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("LLM_RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("LLM_RESPONSE_CACHE_SIMILARITY", "0")) or None
+RESPONSE_CACHE_EMBEDDING_MODEL = os.getenv("LLM_RESPONSE_CACHE_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+cache_query_embeddings: Optional[CachedEmbeddings] = None
+cache_pool = BoundedExecutor("language-cache", max_workers=2, max_queued=32) # Query embedding is CPU-bound
+
+
+def embed_cache_query(text: str) -> Optional[List[float]]:
+    """
+    Query vector for similarity lookups, from the model shared with the retriever. None until the model
+    is ready (startup loads it in the background), so a lookup never pays for loading it.
+    """
+    global cache_query_embeddings
+    if embedding_model_status(RESPONSE_CACHE_EMBEDDING_MODEL) != MODEL_READY:
+        return None
+    if cache_query_embeddings is None:
+        cache_query_embeddings = CachedEmbeddings(get_embedding_model(RESPONSE_CACHE_EMBEDDING_MODEL), RESPONSE_CACHE_EMBEDDING_MODEL)
+    return cache_query_embeddings.embed_query(text)
+
+
+def warmup_cache_query_model() -> None:
+    try:
+        warmup_embedding_model(RESPONSE_CACHE_EMBEDDING_MODEL)
+    except Exception as e:
+        print(f"WARNING: Could not load '{RESPONSE_CACHE_EMBEDDING_MODEL}', the response cache matches exact queries only: {e}")
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_SIMILARITY,
+                               embed_query=embed_cache_query if RESPONSE_CACHE_SIMILARITY else None)
+
 if not GEMINI_API_KEY:
     print(f"WARNING: GEMINI_API_KEY not found. LangChain Google LLM ({MODEL_NAME}) will not be initialized.")
 else:
@@ -28,8 +86,51 @@ else:
         print(f"Error initializing LangChain ChatGoogleGenerativeAI model ({MODEL_NAME}): {e}")
         llm = None
 
+async def invoke_llm(messages: list, timeout: float) -> str:
+    """Runs one chat completion under the concurrency limit. Raises HTTPException(504) past the timeout."""
+    async def call():
+        async with llm_semaphore:
+            response = await llm.ainvoke(messages)
+        return response.content.strip()
+    try:
+        return await asyncio.wait_for(call(), timeout=timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Language model did not respond within {timeout:g}s.")
+
+async def stream_llm(messages: list, timeout: float) -> AsyncIterator[str]:
+    """Like invoke_llm, but yields text chunks as the model produces them. The timeout covers the whole stream."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    try:
+        await asyncio.wait_for(llm_semaphore.acquire(), timeout=timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Language model did not respond within {timeout:g}s.")
+    stream = None
+    try:
+        stream = llm.astream(messages).__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), timeout=max(deadline - loop.time(), 0))
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=504, detail=f"Language model did not finish within {timeout:g}s.")
+            if chunk.content:
+                yield chunk.content
+    finally:
+        llm_semaphore.release()
+        if stream is not None:
+            await stream.aclose()
+
 app = FastAPI()
 
+@app.on_event("startup")
+async def startup_event():
+    # The tokenizer may have to be downloaded, so it loads in the background; prompts are budgeted with the estimate until then
+    asyncio.ensure_future(asyncio.to_thread(load_encoding))
+    if RESPONSE_CACHE_SIMILARITY: # Exact-match lookups only until the query model is ready
+        asyncio.ensure_future(asyncio.to_thread(warmup_cache_query_model))
+
 class KeywordGenerationRequest(BaseModel):
     user_query: str
 class KeywordGenerationResponse(BaseModel):
@@ -48,10 +149,12 @@ class SynthesisRequest(BaseModel):
     chat_history: Optional[List[ChatMessageInput]] = [] # Previous turns
     retrieved_rag_context: List[str]
     scraped_news_articles: List[ScrapedArticleInput]
-    portfolio_csv_data: Optional[str] = None
+    portfolio_csv_data: Optional[str] = None # Raw holdings CSV; summarized here if portfolio_summary isn't given
+    portfolio_summary: Optional[Dict[str, Any]] = None # Output of portfolio_summary.summarize_portfolio
 
 class SynthesisResponse(BaseModel):
     narrative: str
+    cached: bool = False # Served from the response cache without an LLM call
 
 @app.post("/generate_keywords", response_model=KeywordGenerationResponse)
 async def generate_keywords_for_news_search(request: KeywordGenerationRequest):
@@ -59,49 +162,64 @@ async def generate_keywords_for_news_search(request: KeywordGenerationRequest):
     prompt_text = f"""Given the user's financial query: "{request.user_query}" Generate a concise and effective search query string (2 to 5 keywords, including company names or symbols if present) for financial news. Focus on entities, actions, and financial terms. E.g., "Apple AAPL TSMC TSM regulations risk news" or "Nvidia NVDA earnings results". Output ONLY the search query string."""
     messages = [HumanMessage(content=prompt_text)]
     try:
-        response = llm.invoke(messages); keywords = response.content.strip()
+        keywords = await invoke_llm(messages, KEYWORDS_TIMEOUT_SECONDS)
         print(f"LanguageAgent (/generate_keywords): Generated: '{keywords}' for query: '{request.user_query}'")
         return KeywordGenerationResponse(keywords=keywords)
+    except HTTPException as e: raise e
     except Exception as e: raise HTTPException(status_code=500, detail=f"Failed to generate keywords: {str(e)}")
 
 
-def generate_llm_narrative_langchain(
+SYSTEM_PROMPT = "You are a highly capable financial analyst AI. Your task is to generate a concise, data-driven, and professional market brief—no longer than 3–4 lines—based on the user's query, conversation history, and provided information. Be crisp, accurate, and professional."
+PORTFOLIO_HEADER = ("Portfolio Summary (JSON; values in USD, *_pct in percent, *change_pct is day-over-day; "
+                    "\"focus\" holds the positions matching the query):")
+PORTFOLIO_LIST_LIMITS = (MAX_FOCUS_HOLDINGS, 10, 5, 3, 1, 0) # Holding-list lengths tried, longest first, to fit the budget
+
+
+def _news_item(index: int, article: ScrapedArticleInput) -> str:
+    lines = [f"\n--- News {index}: {article.title or 'N/A'} (Source: {article.source or 'N/A'}, Updated: {article.lastUpdated or 'N/A'}) ---"]
+    if article.summary: lines.append(f"Summary: {article.summary}")
+    elif article.snippet: lines.append(f"Snippet: {article.snippet}")
+    return "\n".join(lines)
+
+
+def _render_portfolio_summary(summary: Dict[str, Any], max_items: int) -> str:
+    return f"\n{PORTFOLIO_HEADER}\n{json.dumps(compact_summary(summary, max_items), separators=(',', ':'))}\n"
+
+
+def _fit_portfolio_summary(summary: Optional[Dict[str, Any]], budget: int) -> str:
+    """Rendered summary with its holding lists shortened until it fits; JSON is never cut mid-way, so it is dropped if even the bare aggregates don't fit."""
+    if not summary:
+        return ""
+    for max_items in PORTFOLIO_LIST_LIMITS:
+        text = _render_portfolio_summary(summary, max_items)
+        if count_tokens(text) <= budget:
+            return text
+    return ""
+
+
+def build_synthesis_messages(
     user_query: str,
     chat_history: Optional[List[ChatMessageInput]],
     retrieved_rag_context: List[str],
     scraped_news_articles: List[ScrapedArticleInput],
-    portfolio_csv_data: Optional[str]
-) -> str:
-    global llm
-    if not llm:
-        raise HTTPException(status_code=503, detail="LangChain Google LLM not initialized.")
+    portfolio_csv_data: Optional[str],
+    portfolio_summary: Optional[Dict[str, Any]] = None
+) -> List[SystemMessage | HumanMessage | AIMessage]:
+    """
+    Prompt shared by /synthesize and /synthesize_stream: system instructions, chat history, then the current
+    turn with all context. The whole prompt is kept within PROMPT_TOKEN_BUDGET: after the fixed parts, the
+    context sections share what is left by PROMPT_SECTION_SHARES, and each section truncates or drops its
+    lowest-ranked items. Older chat turns that don't fit are condensed into the system message.
+    """
+    if portfolio_summary is None and portfolio_csv_data:
+        # The raw CSV runs to tens of thousands of tokens; only its aggregates go into the prompt
+        portfolio_summary = summarize_portfolio(parse_portfolio_csv(portfolio_csv_data), user_query)
+    turns = [(msg.role, msg.content) for msg in chat_history or [] if msg.role in ("user", "assistant")]
+    rag_items = list(retrieved_rag_context)
+    news_items = [_news_item(i, article) for i, article in enumerate(scraped_news_articles, 1)]
 
-    langchain_messages: List[SystemMessage | HumanMessage | AIMessage] = [
-        SystemMessage(content="You are a highly capable financial analyst AI. Your task is to generate a concise, data-driven, and professional market brief—no longer than 3–4 lines—based on the user's query, conversation history, and provided information. Be crisp, accurate, and professional.")
-    ]
-    if chat_history:
-        for msg in chat_history:
-            if msg.role == "user":
-                langchain_messages.append(HumanMessage(content=msg.content))
-            elif msg.role == "assistant": # Assuming "assistant" role from history
-                langchain_messages.append(AIMessage(content=msg.content))
-
-    rag_context_string = "\n\n".join(retrieved_rag_context)
-    news_context_parts = []
-    if scraped_news_articles:
-        news_context_parts.append("Recent News Summaries (use for current events/sentiment):")
-        for i, article in enumerate(scraped_news_articles, 1):
-            news_context_parts.append(f"\n--- News {i}: {article.title or 'N/A'} (Source: {article.source or 'N/A'}, Updated: {article.lastUpdated or 'N/A'}) ---")
-            if article.summary: news_context_parts.append(f"Summary: {article.summary}")
-            elif article.snippet: news_context_parts.append(f"Snippet: {article.snippet}")
-    news_context_string = "\n".join(news_context_parts)
-
-    portfolio_info_string = ""
-    if portfolio_csv_data:
-        portfolio_info_string = f"\nPortfolio Data (raw CSV - interpret for holdings/context):\n<csv>\n{portfolio_csv_data}\n</csv>\n"
-    
-    # 3. Construct the content for the *current* user query, including all context
-    current_turn_prompt_content = f"""
+    def current_turn(portfolio_info_string: str, rag_context_string: str, news_context_string: str) -> str:
+        return f"""
 User's Current Query: "{user_query}"
 
 {portfolio_info_string if portfolio_info_string else "No portfolio data provided for this query."}
@@ -113,23 +231,114 @@ Background Information (from internal documents, if relevant):
 
 Instructions for your response (max 4 lines for the brief itself):
 1. Directly address the CURRENT user query, considering conversation history for context.
-2. If portfolio data is relevant and provided, infer holdings and values (Quantity * CurrentPrice from CSV). State if data for detailed calculations (like total AUM or comparisons) is missing.
+2. If portfolio data is relevant and provided, use the summary's AUM, allocations, focus positions and day-over-day changes. State if data for a requested calculation is missing.
 3. For earnings surprises, cite news summaries if specific percentages are mentioned. Otherwise, describe general performance.
 4. Synthesize regional sentiment from news if asked; mention drivers like 'rising yields' ONLY IF in provided news/background.
 5. If information is unavailable, state that. DO NOT FABRICATE.
 """
+
+    fixed_tokens = count_tokens(SYSTEM_PROMPT) + count_tokens(current_turn("", "", "")) + 2 * MESSAGE_OVERHEAD_TOKENS
+    needs = { # Insertion order is priority order
+        "portfolio": count_tokens(_render_portfolio_summary(portfolio_summary, MAX_FOCUS_HOLDINGS)) if portfolio_summary else 0,
+        "rag": sum(count_tokens(item) + 2 for item in rag_items),
+        "news": count_tokens(NEWS_HEADER) + sum(count_tokens(item) for item in news_items) if news_items else 0,
+        "history": sum(count_tokens(content) + MESSAGE_OVERHEAD_TOKENS for _, content in turns),
+    }
+    available = remaining = PROMPT_TOKEN_BUDGET - fixed_tokens
+
+    def section_budget(name: str) -> int:
+        # Sections are fitted in priority order. Each may use whatever the later ones' shares don't
+        # reserve, so budget an earlier section leaves unused goes to the ones after it
+        later = list(needs)[list(needs).index(name) + 1:]
+        reserved = sum(min(needs[key], int(PROMPT_SECTION_SHARES[key] * available)) for key in later)
+        return min(needs[name], max(remaining - reserved, 0))
+
+    portfolio_budget = section_budget("portfolio")
+    if portfolio_summary: # The bare aggregates outrank any single document, so they may exceed the share
+        portfolio_budget = max(portfolio_budget, min(count_tokens(_render_portfolio_summary(portfolio_summary, 0)), remaining))
+    portfolio_info_string = _fit_portfolio_summary(portfolio_summary, portfolio_budget)
+    remaining -= count_tokens(portfolio_info_string)
+
+    kept_rag = fit_items(rag_items, section_budget("rag") - 2 * len(rag_items))
+    rag_context_string = "\n\n".join(kept_rag)
+    remaining -= sum(count_tokens(item) + 2 for item in kept_rag)
+
+    kept_news = fit_items(news_items, section_budget("news") - count_tokens(NEWS_HEADER))
+    news_context_string = "\n".join([NEWS_HEADER, *kept_news]) if kept_news else ""
+    omitted = len(rag_items) - len(kept_rag) + len(news_items) - len(kept_news)
+    if omitted:
+        news_context_string += f"\n({omitted} lower-ranked documents/articles omitted to fit the prompt budget.)"
+    remaining -= count_tokens(news_context_string)
+
+    history_summary, kept_turns = fit_chat_history(turns, section_budget("history"))
+
+    system_content = SYSTEM_PROMPT
+    if history_summary:
+        system_content += f"\n\nEarlier conversation (condensed):\n{history_summary}"
+    langchain_messages: List[SystemMessage | HumanMessage | AIMessage] = [SystemMessage(content=system_content)]
+    for role, content in kept_turns:
+        langchain_messages.append(HumanMessage(content=content) if role == "user" else AIMessage(content=content))
+    current_turn_prompt_content = current_turn(portfolio_info_string, rag_context_string, news_context_string)
     langchain_messages.append(HumanMessage(content=current_turn_prompt_content))
-    
+
+    print(f"LanguageAgent (/synthesize): Built prompt within {PROMPT_TOKEN_BUDGET} tokens. Fixed: {fixed_tokens}, "
+          f"portfolio: {count_tokens(portfolio_info_string)}/{needs['portfolio']}, RAG: {len(kept_rag)}/{len(rag_items)} docs, "
+          f"news: {len(kept_news)}/{len(news_items)} articles, history: {len(kept_turns)}/{len(turns)} turns verbatim"
+          f"{', older condensed' if history_summary else ''}.")
+    return langchain_messages
+
+
+async def generate_llm_narrative_langchain(
+    user_query: str,
+    chat_history: Optional[List[ChatMessageInput]],
+    retrieved_rag_context: List[str],
+    scraped_news_articles: List[ScrapedArticleInput],
+    portfolio_csv_data: Optional[str],
+    portfolio_summary: Optional[Dict[str, Any]] = None
+) -> str:
+    global llm
+    if not llm:
+        raise HTTPException(status_code=503, detail="LangChain Google LLM not initialized.")
+
+    langchain_messages = build_synthesis_messages(
+        user_query, chat_history, retrieved_rag_context, scraped_news_articles, portfolio_csv_data, portfolio_summary
+    )
     try:
-        print(f"LanguageAgent (/synthesize): Invoking LLM. History turns: {len(chat_history or [])}. Current prompt content approx length: {len(current_turn_prompt_content)}")
-        response = llm.invoke(langchain_messages) # Pass the full message list
-        narrative = response.content.strip()
+        narrative = await invoke_llm(langchain_messages, SYNTHESIS_TIMEOUT_SECONDS) # Pass the full message list
         print(f"LanguageAgent (/synthesize): Generated narrative successfully.")
         return narrative
+    except HTTPException as e:
+        raise e
     except Exception as e:
         print(f"LanguageAgent (/synthesize): LLM Error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"LLM synthesis error: {str(e)}")
 
+def synthesis_context_key(request: SynthesisRequest) -> str:
+    """
+    Fingerprint of the synthesis context besides the query. RAG chunks are identified by their text (chunk IDs
+    change on rebuilds), articles by URL and update time, and the portfolio by its summary, which carries the
+    as-of date and values. Chat history is included, since follow-up questions depend on it.
+    """
+    return context_fingerprint(
+        sorted(request.retrieved_rag_context),
+        sorted((article.url, article.lastUpdated or "") for article in request.scraped_news_articles),
+        request.portfolio_summary if request.portfolio_summary is not None else request.portfolio_csv_data,
+        [(msg.role, msg.content) for msg in request.chat_history or []],
+    )
+
+
+async def run_cache(fn, *args):
+    """Cache calls may embed the query, so they run off the event loop; a saturated pool just bypasses the cache."""
+    if RESPONSE_CACHE_SIZE <= 0:
+        return None
+    if response_cache.similarity_threshold is None:
+        return fn(*args) # Exact lookups are plain dict operations
+    try:
+        return await cache_pool.run(fn, *args)
+    except PoolSaturated:
+        return None
+
+
 @app.post("/synthesize", response_model=SynthesisResponse)
 async def synthesize_narrative(request: SynthesisRequest):
     if not llm:
@@ -139,17 +348,81 @@ async def synthesize_narrative(request: SynthesisRequest):
               f"History items: {len(request.chat_history or [])}, "
               f"{len(request.retrieved_rag_context)} RAG_docs, "
               f"{len(request.scraped_news_articles)} news_articles. "
-              f"Portfolio CSV provided: {bool(request.portfolio_csv_data)}")
-        
-        narrative_text = generate_llm_narrative_langchain(
+              f"Portfolio summary provided: {bool(request.portfolio_summary)}, CSV provided: {bool(request.portfolio_csv_data)}")
+
+        started = time.perf_counter()
+        context_key = synthesis_context_key(request)
+        cached_narrative = await run_cache(response_cache.get, request.user_query, context_key)
+        if cached_narrative is not None:
+            print(f"LanguageAgent (/synthesize): Served narrative from cache in {(time.perf_counter() - started) * 1000:.1f}ms.")
+            return SynthesisResponse(narrative=cached_narrative, cached=True)
+
+        narrative_text = await generate_llm_narrative_langchain(
             request.user_query,
             request.chat_history, # Pass the history
             request.retrieved_rag_context,
             request.scraped_news_articles,
-            request.portfolio_csv_data
+            request.portfolio_csv_data,
+            request.portfolio_summary
         )
+        await run_cache(response_cache.put, request.user_query, context_key, narrative_text)
         return SynthesisResponse(narrative=narrative_text)
     except HTTPException as e:
         raise e
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Unexpected error in synthesis: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Unexpected error in synthesis: {str(e)}")
+
+@app.post("/synthesize_stream")
+async def synthesize_narrative_stream(request: SynthesisRequest):
+    """
+    Same input and prompt as /synthesize, streamed as NDJSON while Gemini generates it: one
+    {"type": "token", "text": ...} line per chunk, then {"type": "done", "narrative": ...} with the full
+    text, or {"type": "error", "detail": ...} if generation fails part-way. A cache hit is sent as a single
+    token line followed by "done".
+    """
+    if not llm:
+        raise HTTPException(status_code=503, detail="Language model not initialized.")
+    context_key = synthesis_context_key(request)
+    cached_narrative = await run_cache(response_cache.get, request.user_query, context_key)
+    if cached_narrative is not None:
+        print(f"LanguageAgent (/synthesize_stream): Served narrative from cache.")
+        lines = [json.dumps({"type": "token", "text": cached_narrative}) + "\n",
+                 json.dumps({"type": "done", "narrative": cached_narrative, "cached": True}) + "\n"]
+        return StreamingResponse(iter(lines), media_type="application/x-ndjson")
+    langchain_messages = build_synthesis_messages(
+        request.user_query,
+        request.chat_history,
+        request.retrieved_rag_context,
+        request.scraped_news_articles,
+        request.portfolio_csv_data,
+        request.portfolio_summary
+    )
+
+    async def narrative_events():
+        parts = []
+        try:
+            async for text in stream_llm(langchain_messages, SYNTHESIS_TIMEOUT_SECONDS):
+                parts.append(text)
+                yield json.dumps({"type": "token", "text": text}) + "\n"
+            print(f"LanguageAgent (/synthesize_stream): Streamed narrative successfully.")
+            narrative = "".join(parts).strip()
+            await run_cache(response_cache.put, request.user_query, context_key, narrative)
+            yield json.dumps({"type": "done", "narrative": narrative}) + "\n"
+        except HTTPException as e:
+            yield json.dumps({"type": "error", "detail": e.detail}) + "\n"
+        except Exception as e:
+            print(f"LanguageAgent (/synthesize_stream): LLM Error: {str(e)}")
+            yield json.dumps({"type": "error", "detail": f"LLM synthesis error: {str(e)}"}) + "\n"
+
+    return StreamingResponse(narrative_events(), media_type="application/x-ndjson")
+
+
+@app.get("/response_cache")
+async def response_cache_stats():
+    return response_cache.stats()
+
+
+@app.delete("/response_cache")
+async def clear_response_cache():
+    response_cache.clear()
+    return {"status": "cleared"}
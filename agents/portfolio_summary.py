@@ -0,0 +1,146 @@
+# /agents/portfolio_summary.py
+# Compact, query-aware portfolio aggregates for LLM prompts, computed from the multi-day holdings CSV.
+import io
+import re
+import csv
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+TOP_HOLDINGS = 10
+TOP_MOVERS = 5
+MAX_FOCUS_HOLDINGS = 25
+# Query words that name a sector or region without using its exact label
+SECTOR_ALIASES = {"tech": "Technology", "technology": "Technology", "healthcare": "Health Care", "pharma": "Health Care",
+                  "banks": "Financials", "financial": "Financials", "oil": "Energy", "property": "Real Estate"}
+REGION_ALIASES = {"asian": "Asia", "european": "Europe", "u.s.": "North America", "american": "North America",
+                  "emerging": "Emerging Markets"}
+
+
+def parse_portfolio_csv(csv_text: str) -> List[Dict[str, Any]]:
+    """Rows of the holdings CSV (Date, Ticker, Company Name, Region, Sector, Price, Shares, Market Value) with numbers parsed."""
+    rows = []
+    for row in csv.DictReader(io.StringIO(csv_text)):
+        try:
+            rows.append({
+                "date": row["Date"], "ticker": row["Ticker"], "company": row["Company Name"],
+                "region": row["Region"], "sector": row["Sector"], "price": float(row["Price"]),
+                "shares": float(row["Shares"]), "value": float(row["Market Value"]),
+            })
+        except (KeyError, ValueError):
+            continue # Skip malformed rows rather than failing the whole brief
+    return rows
+
+
+def _pct_change(current: float, previous: Optional[float]) -> Optional[float]:
+    if not previous:
+        return None
+    return round((current - previous) / previous * 100, 2)
+
+
+def _group(rows: List[Dict[str, Any]], field: str) -> Dict[str, float]:
+    totals: Dict[str, float] = defaultdict(float)
+    for row in rows:
+        totals[row[field]] += row["value"]
+    return totals
+
+
+def _allocation(latest: Dict[str, float], previous: Dict[str, float], aum: float) -> List[Dict[str, Any]]:
+    return [
+        {"name": name, "value": round(value, 2), "weight_pct": round(value / aum * 100, 2) if aum else None,
+         "change_pct": _pct_change(value, previous.get(name))}
+        for name, value in sorted(latest.items(), key=lambda item: item[1], reverse=True)
+    ]
+
+
+def _holding(row: Dict[str, Any], previous_row: Optional[Dict[str, Any]], aum: float) -> Dict[str, Any]:
+    return {
+        "ticker": row["ticker"], "company": row["company"], "region": row["region"], "sector": row["sector"],
+        "price": row["price"], "shares": row["shares"], "value": round(row["value"], 2),
+        "weight_pct": round(row["value"] / aum * 100, 2) if aum else None,
+        "price_change_pct": _pct_change(row["price"], previous_row["price"] if previous_row else None),
+    }
+
+
+def match_query_focus(query: str, rows: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """Regions, sectors and tickers the query mentions, matched against the labels present in the portfolio."""
+    tokens = re.findall(r"[A-Za-z0-9.&]+", query)
+    words = {token.lower() for token in tokens}
+    text = f" {' '.join(token.lower() for token in tokens)} " # Multi-word labels like "north america"
+
+    def names_holding(row):
+        ticker, company_word = row["ticker"], row["company"].split()[0].strip(",.").lower()
+        # Short tickers ("T", "GE") only count when written in capitals, so plain words don't match them
+        return ticker in tokens or (len(ticker) >= 4 and ticker.lower() in words) or (len(company_word) >= 4 and company_word in words)
+
+    focus = {
+        "regions": sorted({row["region"] for row in rows if f" {row['region'].lower()} " in text}
+                          | {REGION_ALIASES[word] for word in words if word in REGION_ALIASES}),
+        "sectors": sorted({row["sector"] for row in rows if f" {row['sector'].lower()} " in text}
+                          | {SECTOR_ALIASES[word] for word in words if word in SECTOR_ALIASES}),
+        "tickers": sorted({row["ticker"] for row in rows if names_holding(row)}),
+    }
+    return {key: values for key, values in focus.items() if values}
+
+
+def summarize_portfolio(rows: List[Dict[str, Any]], query: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Latest-day AUM, region/sector allocation and top holdings, each with the day-over-day change.
+    When the query names regions, sectors or holdings, a "focus" block lists the matching positions
+    (region AND sector, OR named ticker/company) with their subtotal.
+    """
+    if not rows:
+        return {}
+    dates = sorted({row["date"] for row in rows})
+    latest_date = dates[-1]
+    previous_date = dates[-2] if len(dates) > 1 else None
+    latest_rows = [row for row in rows if row["date"] == latest_date]
+    previous_rows = [row for row in rows if row["date"] == previous_date]
+    previous_by_ticker = {row["ticker"]: row for row in previous_rows}
+    aum = sum(row["value"] for row in latest_rows)
+    previous_aum = sum(row["value"] for row in previous_rows) if previous_rows else None
+
+    by_value = sorted(latest_rows, key=lambda row: row["value"], reverse=True)
+    movers = [row for row in latest_rows if row["ticker"] in previous_by_ticker]
+    movers.sort(key=lambda row: abs(_pct_change(row["price"], previous_by_ticker[row["ticker"]]["price"]) or 0), reverse=True)
+    summary = {
+        "as_of": latest_date,
+        "compared_to": previous_date,
+        "num_holdings": len(latest_rows),
+        "aum": round(aum, 2),
+        "aum_change_pct": _pct_change(aum, previous_aum),
+        "regions": _allocation(_group(latest_rows, "region"), _group(previous_rows, "region"), aum),
+        "sectors": _allocation(_group(latest_rows, "sector"), _group(previous_rows, "sector"), aum),
+        "top_holdings": [_holding(row, previous_by_ticker.get(row["ticker"]), aum) for row in by_value[:TOP_HOLDINGS]],
+        "top_movers": [_holding(row, previous_by_ticker[row["ticker"]], aum) for row in movers[:TOP_MOVERS]],
+    }
+
+    focus = match_query_focus(query or "", latest_rows)
+    if focus:
+        def in_focus(row):
+            if row["ticker"] in focus.get("tickers", []):
+                return True
+            if not (focus.get("regions") or focus.get("sectors")):
+                return False
+            return (row["region"] in focus.get("regions", [row["region"]])
+                    and row["sector"] in focus.get("sectors", [row["sector"]]))
+        focus_rows = [row for row in by_value if in_focus(row)]
+        focus_value = sum(row["value"] for row in focus_rows)
+        previous_focus_value = sum(previous_by_ticker[row["ticker"]]["value"] for row in focus_rows if row["ticker"] in previous_by_ticker)
+        summary["focus"] = {
+            **focus,
+            "num_holdings": len(focus_rows),
+            "value": round(focus_value, 2),
+            "weight_pct": round(focus_value / aum * 100, 2) if aum else None,
+            "change_pct": _pct_change(focus_value, previous_focus_value),
+            "holdings": [_holding(row, previous_by_ticker.get(row["ticker"]), aum) for row in focus_rows[:MAX_FOCUS_HOLDINGS]],
+        }
+    return summary
+
+
+def compact_summary(summary: Dict[str, Any], max_items: int) -> Dict[str, Any]:
+    """Copy of a summary with its holding lists (top holdings, movers, focus positions) cut to max_items each."""
+    compact = {**summary, "top_holdings": summary.get("top_holdings", [])[:max_items],
+               "top_movers": summary.get("top_movers", [])[:max_items]}
+    if "focus" in summary:
+        compact["focus"] = {**summary["focus"], "holdings": summary["focus"].get("holdings", [])[:max_items]}
+    return compact
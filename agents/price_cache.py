@@ -0,0 +1,118 @@
+# /agents/price_cache.py
+# In-memory (optionally SQLite-backed) cache for daily stock closes with single-flight fetching.
+# Lookups only touch memory; SQLite is read once at startup and written from a background thread.
+import json
+import time
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+# AlphaVantage publishes the day's close some time after the 16:00 ET bell; refresh after this hour
+DAILY_REFRESH_HOUR = 17
+
+
+def next_daily_refresh(now: Optional[datetime] = None) -> datetime:
+    """
+    Returns the next time a new daily close can appear: DAILY_REFRESH_HOUR ET on the next weekday.
+    Exchange holidays are not modelled; on those days the cache simply refreshes to the same data.
+    """
+    now = (now or datetime.now(MARKET_TIMEZONE)).astimezone(MARKET_TIMEZONE)
+    refresh_at = now.replace(hour=DAILY_REFRESH_HOUR, minute=0, second=0, microsecond=0)
+    if now >= refresh_at:
+        refresh_at += timedelta(days=1)
+    while refresh_at.weekday() >= 5: # Saturday/Sunday
+        refresh_at += timedelta(days=1)
+    return refresh_at
+
+
+class PriceCache:
+    """
+    Caches price payloads per symbol until the next daily refresh. Concurrent misses for the
+    same symbol share one upstream fetch. If sqlite_path is set, entries also survive restarts:
+    unexpired rows are loaded when the cache is created, and new entries are written by a single
+    background thread, so get() and set() never block the event loop on disk I/O.
+    """
+
+    def __init__(self, sqlite_path: Optional[str] = None, max_ttl_seconds: float = 24 * 3600):
+        self.max_ttl_seconds = max_ttl_seconds
+        self._entries: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._writer: Optional[ThreadPoolExecutor] = None
+        if sqlite_path:
+            try:
+                self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS price_cache (symbol TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                self._db.commit()
+                for symbol, data, expires_at in self._db.execute(
+                    "SELECT symbol, data, expires_at FROM price_cache WHERE expires_at > ?", (time.time(),)
+                ):
+                    self._entries[symbol] = (expires_at, json.loads(data))
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="price-cache-writer") # One writer keeps writes in order
+                print(f"PriceCache: Using on-disk cache at {sqlite_path} ({len(self._entries)} entries loaded)")
+            except Exception as e:
+                print(f"PriceCache: Could not open on-disk cache at {sqlite_path}, using memory only: {e}")
+                self._db = None
+
+    def _expiry_timestamp(self) -> float:
+        return min(next_daily_refresh().timestamp(), time.time() + self.max_ttl_seconds)
+
+    def get(self, symbol: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(symbol)
+        if entry and entry[0] > time.time():
+            return entry[1]
+        return None
+
+    def _write(self, symbol: str, data: str, expires_at: float) -> None:
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO price_cache (symbol, data, expires_at) VALUES (?, ?, ?)",
+                (symbol, data, expires_at)
+            )
+            self._db.commit()
+        except Exception as e:
+            print(f"PriceCache: Error writing on-disk cache for {symbol}: {e}")
+
+    def set(self, symbol: str, data: Dict[str, Any]) -> None:
+        expires_at = self._expiry_timestamp()
+        self._entries[symbol] = (expires_at, data)
+        if self._writer is not None:
+            self._writer.submit(self._write, symbol, json.dumps(data), expires_at)
+
+    def close(self) -> None:
+        """Waits for pending disk writes, then closes the database."""
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    async def _fetch_and_store(self, symbol: str, fetch: Callable[[str], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        data = await fetch(symbol)
+        self.set(symbol, data)
+        return data
+
+    def _on_fetch_done(self, symbol: str, task: asyncio.Task) -> None:
+        self._inflight.pop(symbol, None)
+        if not task.cancelled():
+            task.exception() # Mark as retrieved even if every waiter has gone away
+
+    async def get_or_fetch(self, symbol: str, fetch: Callable[[str], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Returns the cached payload, or awaits the single in-flight fetch for this symbol. Errors are not cached."""
+        cached = self.get(symbol)
+        if cached is not None:
+            return cached
+        task = self._inflight.get(symbol)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_and_store(symbol, fetch))
+            self._inflight[symbol] = task
+            task.add_done_callback(lambda done: self._on_fetch_done(symbol, done))
+        # shield: one caller disconnecting must not cancel the fetch the others are waiting on
+        return await asyncio.shield(task)
@@ -0,0 +1,102 @@
+# /agents/prompt_budget.py
+# Token budgeting for LLM prompts: count tokens locally, then truncate or drop context items to fit a budget.
+import re
+from itertools import islice
+from typing import List, Optional, Tuple
+
+MIN_ITEM_TOKENS = 40        # A cut-down item shorter than this is more noise than signal, so it is dropped instead
+MESSAGE_OVERHEAD_TOKENS = 4 # Role markers and separators around each chat message
+HISTORY_SUMMARY_SHARE = 0.25 # Part of the history budget kept for the condensed older turns
+SUMMARY_SNIPPET_CHARS = 200 # Per older chat turn in the condensed history
+TRUNCATION_MARKER = " …"
+
+_TOKEN_PATTERN = re.compile(r"\w{1,4}|[^\w\s]") # Fallback estimate: ~4 characters per word piece, 1 per symbol
+_encoding = None
+
+
+def load_encoding() -> None:
+    """
+    Loads the cl100k encoder. tiktoken downloads its BPE file on first use, so this blocks: call it
+    off the event loop (the language agent does at startup). Counting never loads it inline.
+    """
+    global _encoding
+    if _encoding is not None:
+        return
+    try:
+        import tiktoken # Optional
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"PromptBudget: tiktoken unavailable, estimating token counts instead: {e}")
+
+
+def _get_encoding():
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """
+    Local token count: cl100k via tiktoken once load_encoding() has run, otherwise a word-piece estimate.
+    Gemini has no offline tokenizer, so both approximate its own count; budgets should leave some headroom.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(1 for _ in _TOKEN_PATTERN.finditer(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text to at most max_tokens (marker included); returns "" when not even the marker fits."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    keep = max_tokens - count_tokens(TRUNCATION_MARKER)
+    if keep <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:keep]).rstrip() + TRUNCATION_MARKER
+    pieces = list(islice(_TOKEN_PATTERN.finditer(text), keep))
+    return text[:pieces[-1].end()].rstrip() + TRUNCATION_MARKER
+
+
+def fit_items(items: List[str], budget: int) -> List[str]:
+    """Keeps items (highest priority first) while they fit; the first one that doesn't is truncated, the rest dropped."""
+    kept = []
+    for item in items:
+        cost = count_tokens(item)
+        if cost <= budget:
+            kept.append(item)
+            budget -= cost
+            continue
+        if budget >= MIN_ITEM_TOKENS:
+            kept.append(truncate_to_tokens(item, budget))
+        break
+    return kept
+
+
+def _first_sentence(text: str) -> str:
+    text = " ".join(text.split())
+    match = re.search(r"(?<=[.!?])\s", text)
+    sentence = text[:match.start()] if match else text
+    return sentence if len(sentence) <= SUMMARY_SNIPPET_CHARS else sentence[:SUMMARY_SNIPPET_CHARS].rstrip() + "…"
+
+
+def fit_chat_history(turns: List[Tuple[str, str]], budget: int) -> Tuple[Optional[str], List[Tuple[str, str]]]:
+    """
+    Fits (role, content) turns, oldest first, into budget. When they all fit they are kept verbatim.
+    Otherwise the newest turns are kept verbatim and the older ones are condensed into an extractive
+    summary (the first sentence of each, newest first if even that overflows). Returns (summary or None, kept turns).
+    """
+    costs = [count_tokens(content) + MESSAGE_OVERHEAD_TOKENS for _, content in turns]
+    if sum(costs) <= budget:
+        return None, list(turns)
+    recent_budget = budget - int(budget * HISTORY_SUMMARY_SHARE)
+    split = len(turns)
+    used = 0
+    while split > 0 and used + costs[split - 1] <= recent_budget:
+        split -= 1
+        used += costs[split]
+    older = [f"{role}: {_first_sentence(content)}" for role, content in turns[:split]]
+    lines = fit_items(older[::-1], budget - used - MESSAGE_OVERHEAD_TOKENS)[::-1]
+    return ("\n".join(lines) if lines else None), list(turns[split:])
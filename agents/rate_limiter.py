@@ -0,0 +1,91 @@
+# /agents/rate_limiter.py
+# Client-side token-bucket scheduler so outbound calls queue up instead of tripping upstream quotas.
+import time
+import heapq
+import asyncio
+import itertools
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+PRIORITY_INTERACTIVE = 0 # User-facing requests are always served first
+PRIORITY_BACKGROUND = 1  # Cache warmup and other batch work
+
+PRIORITY_LANES = {"interactive": PRIORITY_INTERACTIVE, "background": PRIORITY_BACKGROUND}
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+class TokenBucketRateLimiter:
+    """
+    Grants at most `per_minute` calls per minute (refilled continuously, bursts up to `per_minute`)
+    and at most `per_day` calls per rolling 24 hours (0 disables the daily quota).
+    Waiters are served in priority order, FIFO within a lane.
+    """
+
+    def __init__(self, per_minute: int, per_day: int = 0):
+        self.per_minute = max(per_minute, 1)
+        self.per_day = per_day
+        self._tokens = float(self.per_minute)
+        self._last_refill = time.monotonic()
+        self._day_calls: Deque[float] = deque()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.per_minute, self._tokens + (now - self._last_refill) * self.per_minute / 60.0)
+        self._last_refill = now
+        while self._day_calls and now - self._day_calls[0] >= 86400:
+            self._day_calls.popleft()
+
+    def _daily_quota_exhausted(self) -> bool:
+        return self.per_day > 0 and len(self._day_calls) >= self.per_day
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done(): # Skip waiters that timed out or were cancelled
+                return waiter
+        return None
+
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            self._refill()
+            if self._daily_quota_exhausted():
+                # Waiting hours for the rolling window to free up is pointless for a queued request
+                while (waiter := self._next_waiter()) is not None:
+                    waiter.set_exception(RateLimitExceeded(f"Daily quota of {self.per_day} calls exhausted."))
+                break
+            if self._tokens >= 1:
+                waiter = self._next_waiter()
+                if waiter is None:
+                    break
+                self._tokens -= 1
+                self._day_calls.append(time.monotonic())
+                waiter.set_result(None)
+            else:
+                await asyncio.sleep((1 - self._tokens) * 60.0 / self.per_minute)
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE, max_wait: Optional[float] = None) -> None:
+        """Waits for a call slot. Raises RateLimitExceeded if none is granted within max_wait seconds."""
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), waiter))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        try:
+            await asyncio.wait_for(waiter, timeout=max_wait)
+        except asyncio.TimeoutError:
+            raise RateLimitExceeded(f"No call slot available within {max_wait:.0f}s ({self.per_minute}/min limit).")
+
+    def stats(self) -> dict:
+        self._refill()
+        return {
+            "per_minute": self.per_minute,
+            "per_day": self.per_day,
+            "tokens_available": round(self._tokens, 2),
+            "calls_last_24h": len(self._day_calls),
+            "queued": sum(1 for _, _, waiter in self._waiters if not waiter.done()),
+        }
@@ -0,0 +1,112 @@
+# /agents/reranker.py
+# Optional cross-encoder rerank stage for retrieval, with a (query, chunk) score cache and a latency budget.
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from embedding_models import get_cross_encoder, warmup_cross_encoder, embedding_model_status, MODEL_NOT_LOADED, MODEL_READY
+
+COST_SMOOTHING = 0.2 # Weight of the latest batch in the running seconds-per-pair estimate
+
+
+class CrossEncoderReranker:
+    """
+    Rescores first-stage candidates with a cross-encoder. Scores are cached per (query hash, chunk ID);
+    chunk IDs are never reused within a store, so call clear_cache() when a store is rebuilt from scratch.
+    Before scoring, the cost of the uncached pairs is estimated from past batches; if it would overrun
+    the caller's deadline the stage is skipped and the first-stage order is kept. The model is never
+    loaded inside a search: the first request starts a background load and is served unreranked.
+    """
+
+    def __init__(self, model_name: str, cache_size: int = 10000):
+        self.model_name = model_name
+        self.cache_size = cache_size
+        self._scores: "OrderedDict[Tuple[str, int], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.seconds_per_pair: Optional[float] = None # Unknown until the first batch is scored
+        self.reranked = 0
+        self.skipped = 0
+        self.cache_hits = 0
+        self._loader: Optional[threading.Thread] = None
+
+    def _start_background_load(self) -> None:
+        with self._lock:
+            if self._loader is not None:
+                return
+            self._loader = threading.Thread(target=self._load, name="reranker-load", daemon=True)
+        self._loader.start()
+
+    def _load(self) -> None:
+        try:
+            warmup_cross_encoder(self.model_name)
+        except Exception as e: # e.g. sentence-transformers not installed; later calls skip via MODEL_FAILED
+            print(f"Reranker: Could not load '{self.model_name}', searches will keep first-stage order: {e}")
+
+    @staticmethod
+    def _query_key(query: str) -> str:
+        return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._scores.clear()
+
+    def rerank(self, query: str, candidates: List[Tuple[int, str]], top_k: int,
+               deadline: Optional[float] = None) -> Optional[List[Tuple[int, float]]]:
+        """
+        candidates are (chunk_id, text) in first-stage order. Returns the top_k (chunk_id, score) pairs,
+        best first, or None when the stage was skipped (model not loaded yet or unavailable, or not enough time left).
+        """
+        status = embedding_model_status(self.model_name)
+        if status != MODEL_READY:
+            if status == MODEL_NOT_LOADED:
+                self._start_background_load()
+            self.skipped += 1
+            return None
+        query_key = self._query_key(query)
+        scores = {}
+        with self._lock:
+            for chunk_id, _ in candidates:
+                score = self._scores.get((query_key, chunk_id))
+                if score is not None:
+                    self._scores.move_to_end((query_key, chunk_id))
+                    scores[chunk_id] = score
+        missing = [(chunk_id, text) for chunk_id, text in candidates if chunk_id not in scores]
+        self.cache_hits += len(candidates) - len(missing)
+        if missing:
+            if (deadline is not None and self.seconds_per_pair is not None
+                    and time.monotonic() + self.seconds_per_pair * len(missing) > deadline):
+                self.skipped += 1
+                # Let the estimate decay while skipping, so one slow batch can't disable reranking for good
+                self.seconds_per_pair *= 1 - COST_SMOOTHING
+                return None
+            try:
+                model = get_cross_encoder(self.model_name) # Already loaded (MODEL_READY), so this returns at once
+                started = time.perf_counter()
+                new_scores = model.predict([(query, text) for _, text in missing])
+            except Exception as e:
+                print(f"Reranker: Could not score with '{self.model_name}', keeping first-stage order: {e}")
+                self.skipped += 1
+                return None
+            per_pair = (time.perf_counter() - started) / len(missing)
+            self.seconds_per_pair = per_pair if self.seconds_per_pair is None else (
+                (1 - COST_SMOOTHING) * self.seconds_per_pair + COST_SMOOTHING * per_pair)
+            with self._lock:
+                for (chunk_id, _), score in zip(missing, new_scores):
+                    scores[chunk_id] = float(score)
+                    self._scores[(query_key, chunk_id)] = float(score)
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+        self.reranked += 1
+        ranked = sorted(((chunk_id, scores[chunk_id]) for chunk_id, _ in candidates), key=lambda item: item[1], reverse=True)
+        return ranked[:top_k]
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "reranked": self.reranked,
+            "skipped": self.skipped,
+            "cache_hits": self.cache_hits,
+            "cached_scores": len(self._scores),
+            "ms_per_pair": round(self.seconds_per_pair * 1000, 3) if self.seconds_per_pair is not None else None,
+        }
@@ -0,0 +1,119 @@
+# /agents/response_cache.py
+# In-memory cache of synthesized narratives: exact fingerprint lookup plus optional near-duplicate query matching by embedding.
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """Case, punctuation and spacing insensitive form, e.g. "What's our Asia tech exposure?" -> "what s our asia tech exposure"."""
+    return " ".join(re.findall(r"\w+", query.lower()))
+
+
+def context_fingerprint(*parts: Any) -> str:
+    """Stable hash of everything besides the query that shapes an answer (context documents, portfolio version, chat history)."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Narratives keyed by (normalized query, context fingerprint), expiring after ttl_seconds, with the
+    least recently used evicted past max_entries. When embed_query and similarity_threshold are given,
+    an exact miss falls back to the most similar cached query (cosine >= threshold) with the same
+    context fingerprint, so rephrasings of a question about the same data share one answer.
+    embed_query may return None when the model isn't available yet; lookups are then exact only.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity_threshold: Optional[float] = None,
+                 embed_query: Optional[Callable[[str], Optional[List[float]]]] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold if embed_query is not None else None
+        self.embed_query = embed_query
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(normalized_query: str, context_key: str) -> str:
+        return hashlib.sha256(f"{context_key}\x00{normalized_query}".encode("utf-8")).hexdigest()
+
+    def _vector(self, normalized_query: str) -> Optional[np.ndarray]:
+        if self.similarity_threshold is None:
+            return None
+        try:
+            vector = self.embed_query(normalized_query)
+        except Exception as e:
+            print(f"ResponseCache: Could not embed query, using exact matches only: {e}")
+            return None
+        if vector is None:
+            return None
+        vector = np.asarray(vector, dtype="float32")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def get(self, query: str, context_key: str) -> Optional[str]:
+        normalized = normalize_query(query)
+        key = self._key(normalized, context_key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires"] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["narrative"]
+        vector = self._vector(normalized)
+        if vector is not None:
+            with self._lock:
+                best_key, best_score = None, self.similarity_threshold
+                for candidate_key, entry in self._entries.items():
+                    if entry["context_key"] != context_key or entry["vector"] is None or entry["expires"] <= now:
+                        continue
+                    score = float(entry["vector"] @ vector)
+                    if score >= best_score:
+                        best_key, best_score = candidate_key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.similar_hits += 1
+                    return self._entries[best_key]["narrative"]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, query: str, context_key: str, narrative: str) -> None:
+        if self.max_entries <= 0 or not narrative:
+            return
+        normalized = normalize_query(query)
+        vector = self._vector(normalized) # embed_query is expected to cache, so this usually repeats get()'s lookup
+        now = time.monotonic()
+        with self._lock:
+            for expired_key in [key for key, entry in self._entries.items() if entry["expires"] <= now]:
+                del self._entries[expired_key]
+            key = self._key(normalized, context_key)
+            self._entries[key] = {"narrative": narrative, "context_key": context_key, "vector": vector,
+                                  "expires": now + self.ttl_seconds}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "similarity_threshold": self.similarity_threshold,
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+        }
@@ -1,16 +1,102 @@
 import os
+import time
+import uuid
+import asyncio
+import hashlib
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import numpy as np
 from fastapi import FastAPI, HTTPException, Depends
 from pydantic import BaseModel
-from langchain.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
+from chunk_store import ChunkStore, INDEX_TYPES, VECTOR_ENCODINGS
+from bm25_index import reciprocal_rank_fusion
+from document_metadata import extract_document_metadata, METADATA_VERSION
+from sharded_store import ShardedChunkStore, shard_key_for, SHARD_KEYS
+from ingest_pipeline import iter_parsed_files, embed_in_batches, IngestProgress
+from embedding_cache import CachedEmbeddings
+from embedding_models import get_embedding_model, warmup_embedding_model, warmup_cross_encoder, embedding_model_status, MODEL_LOADING, MODEL_READY
+from reranker import CrossEncoderReranker
+from worker_pools import BoundedExecutor, PoolSaturated
 
 # Configuration
 DOCS_PATH = "../data_ingestion/sample_docs" # Path relative to this agent's file
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2" # A good, small sentence transformer
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+
+# FAISS index type: "flat" (exact), "ivf_flat", "ivf_pq" or "hnsw" (approximate, for large corpora)
+INDEX_CONFIG = {
+    "index_type": os.getenv("RETRIEVER_INDEX_TYPE", "flat").lower(),
+    "vector_encoding": os.getenv("RETRIEVER_VECTOR_ENCODING", "float32").lower(), # "fp16"/"int8"/"pq" shrink vector memory
+    "nlist": int(os.getenv("RETRIEVER_IVF_NLIST", "0")), # 0 = 4 * sqrt(num_vectors)
+    "pq_m": int(os.getenv("RETRIEVER_PQ_M", "48")),
+    "hnsw_m": int(os.getenv("RETRIEVER_HNSW_M", "32")),
+    "train_sample_size": int(os.getenv("RETRIEVER_TRAIN_SAMPLE_SIZE", "100000")),
+    "nprobe": int(os.getenv("RETRIEVER_NPROBE", "8")),        # Query-time, IVF only
+    "ef_search": int(os.getenv("RETRIEVER_EF_SEARCH", "64")), # Query-time, HNSW only
+}
+if INDEX_CONFIG["index_type"] not in INDEX_TYPES:
+    print(f"WARNING: Unknown RETRIEVER_INDEX_TYPE '{INDEX_CONFIG['index_type']}', using 'flat'.")
+    INDEX_CONFIG["index_type"] = "flat"
+if INDEX_CONFIG["vector_encoding"] not in VECTOR_ENCODINGS:
+    print(f"WARNING: Unknown RETRIEVER_VECTOR_ENCODING '{INDEX_CONFIG['vector_encoding']}', using 'float32'.")
+    INDEX_CONFIG["vector_encoding"] = "float32"
+
+# Changing any of these invalidates every stored vector, so they key the persisted index
+SETTINGS_KEY = "|".join(str(value) for value in (
+    EMBEDDING_MODEL_NAME, CHUNK_SIZE, CHUNK_OVERLAP, f"metadata-v{METADATA_VERSION}",
+    INDEX_CONFIG["index_type"], INDEX_CONFIG["vector_encoding"], INDEX_CONFIG["nlist"], INDEX_CONFIG["pq_m"], INDEX_CONFIG["hnsw_m"]
+))
+
+# Persisted index: FAISS index keyed by chunk ID + on-disk chunk docstore + per-file manifest (content hash, mtime, chunk IDs)
+INDEX_DIR = os.getenv("RETRIEVER_INDEX_DIR", str(Path(__file__).resolve().parent.parent / "data_ingestion" / "faiss_index"))
+# Optional sharding by document "year" or "region": one index per shard, searched in parallel
+SHARD_BY = os.getenv("RETRIEVER_SHARD_BY", "none").lower()
+if SHARD_BY not in SHARD_KEYS:
+    print(f"WARNING: Unknown RETRIEVER_SHARD_BY '{SHARD_BY}', using 'none'.")
+    SHARD_BY = "none"
+SHARDS_DIR = os.path.join(INDEX_DIR, f"shards_by_{SHARD_BY}")
+SHARD_SEARCH_WORKERS = int(os.getenv("RETRIEVER_SHARD_SEARCH_WORKERS", "4"))
+# Chunk embeddings keyed by (model, text hash) survive rebuilds; set EMBEDDING_CACHE_PATH="" to disable
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(INDEX_DIR, "embedding_cache.sqlite3"))
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+# Embedding and FAISS work runs off the event loop; searches beyond workers + queue get a 503
+SEARCH_WORKERS = int(os.getenv("RETRIEVER_SEARCH_WORKERS", "2"))
+SEARCH_MAX_QUEUED = int(os.getenv("RETRIEVER_SEARCH_MAX_QUEUED", "32"))
+MAX_BATCH_QUERIES = int(os.getenv("RETRIEVER_MAX_BATCH_QUERIES", "1000"))
+# "hybrid" fuses BM25 and vector rankings (RRF), "vector" / "lexical" use one side only
+SEARCH_MODES = ("hybrid", "vector", "lexical")
+DEFAULT_SEARCH_MODE = os.getenv("RETRIEVER_SEARCH_MODE", "hybrid").lower()
+HYBRID_CANDIDATES_PER_SIDE = 4 # Each side contributes top_k * this many candidates to the fusion
+# Optional cross-encoder rerank: over-fetch RERANK_CANDIDATES first-stage hits and rescore them.
+# Skipped (first-stage order kept) when the estimated scoring time would overrun the request's budget.
+RERANK_MODEL_NAME = os.getenv("RETRIEVER_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_BY_DEFAULT = os.getenv("RETRIEVER_RERANK", "false").lower() == "true"
+RERANK_CANDIDATES = int(os.getenv("RETRIEVER_RERANK_CANDIDATES", "20"))
+RERANK_BUDGET_MS = float(os.getenv("RETRIEVER_RERANK_BUDGET_MS", "250"))
+RERANK_CACHE_SIZE = int(os.getenv("RETRIEVER_RERANK_CACHE_SIZE", "10000"))
+# Serve lexical-only results inline when the search pool is saturated or the model is still loading
+LEXICAL_FALLBACK = os.getenv("RETRIEVER_LEXICAL_FALLBACK", "true").lower() == "true"
+# Ingest: files are parsed in a process pool and embedded in fixed-size batches, so memory stays flat
+INGEST_WORKERS = int(os.getenv("RETRIEVER_INGEST_WORKERS", str(min(4, os.cpu_count() or 1)))) # <= 1 parses inline
+INGEST_PREFETCH_FILES = int(os.getenv("RETRIEVER_INGEST_PREFETCH_FILES", "8"))
+EMBED_BATCH_SIZE = int(os.getenv("RETRIEVER_EMBED_BATCH_SIZE", "64"))
+INGEST_FLUSH_CHUNKS = int(os.getenv("RETRIEVER_INGEST_FLUSH_CHUNKS", "2048")) # Chunk records held in memory before writing them out
+MAX_RECALL_SAMPLE_SIZE = 1000
+MAX_BUILD_JOB_HISTORY = 20
 
 vector_store = None
+embeddings = None
+
+search_pool = BoundedExecutor("retriever-search", max_workers=SEARCH_WORKERS, max_queued=SEARCH_MAX_QUEUED)
+# A single build worker serializes index builds; extra build requests join the active job instead
+build_pool = BoundedExecutor("retriever-build", max_workers=1, max_queued=1)
+# BM25 fallback answers when search_pool is full or the model is loading; it walks postings in pure
+# Python, so it gets its own small pool rather than running on the event loop shared by every agent
+fallback_pool = BoundedExecutor("retriever-lexical-fallback", max_workers=1, max_queued=4)
+build_jobs: Dict[str, Dict[str, Any]] = {}
+reranker = CrossEncoderReranker(RERANK_MODEL_NAME, cache_size=RERANK_CACHE_SIZE)
 
 def get_vector_store():
     global vector_store
@@ -18,93 +104,483 @@ def get_vector_store():
         raise HTTPException(status_code=503, detail="Vector store not initialized. Call /build_index first.")
     return vector_store
 
-def initialize_vector_store():
+def get_embeddings() -> CachedEmbeddings:
+    """Wraps the process-wide model once; rebuilds reuse it and only pay for encoding."""
+    global embeddings
+    if embeddings is None:
+        if EMBEDDING_CACHE_PATH:
+            os.makedirs(os.path.dirname(EMBEDDING_CACHE_PATH) or ".", exist_ok=True)
+        embeddings = CachedEmbeddings(
+            get_embedding_model(EMBEDDING_MODEL_NAME),
+            EMBEDDING_MODEL_NAME,
+            cache_path=EMBEDDING_CACHE_PATH,
+            query_cache_size=QUERY_EMBEDDING_CACHE_SIZE
+        )
+    return embeddings
+
+def scan_corpus_files() -> Dict[str, Path]:
+    """Maps each .txt file's path relative to DOCS_PATH to its full path."""
+    if not os.path.exists(DOCS_PATH):
+        return {}
+    return {str(path.relative_to(DOCS_PATH)): path for path in sorted(Path(DOCS_PATH).glob("**/*.txt"))}
+
+def file_sha256(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def plan_corpus_changes(store: ChunkStore, current_files: Dict[str, Path]):
+    """
+    Compares the corpus on disk with the store's manifest. mtime/size is checked first so unchanged
+    files are never read; a file whose mtime changed but whose content hash didn't is only touched.
+    Returns (changed, touched, removed): changed/touched are lists of (source, path, file_info).
+    """
+    changed, touched = [], []
+    for source, path in current_files.items():
+        stat = path.stat()
+        entry = store.files.get(source)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            continue
+        file_info = {"sha256": file_sha256(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if entry and entry["sha256"] == file_info["sha256"]:
+            touched.append((source, path, file_info))
+        else:
+            changed.append((source, path, file_info))
+    removed = [source for source in store.files if source not in current_files]
+    return changed, touched, removed
+
+def sync_chunk_store(index_dir: str, live_store: Optional[ChunkStore], current_files: Dict[str, Path], force_rebuild: bool,
+                     ingest: IngestProgress, progress: Optional[Dict[str, Any]] = None):
+    """
+    Brings the store persisted in index_dir in line with current_files: only new or changed files are
+    embedded, vectors of removed files are deleted. force_rebuild=True discards it and re-embeds everything.
+    Never modifies live_store (the one searches are reading); returns (store, counts) to swap in.
+    """
+    store = None
+    if not force_rebuild:
+        store = live_store if live_store is not None else ChunkStore.load(index_dir, SETTINGS_KEY, index_config=INDEX_CONFIG)
+    is_new_store = store is None
+    if is_new_store:
+        store = ChunkStore(SETTINGS_KEY, INDEX_CONFIG)
+    changed, touched, removed = plan_corpus_changes(store, current_files)
+
+    if not store.supports_removal and (removed or any(source in store.files for source, _, _ in changed)):
+        # HNSW can't delete vectors: rebuild the graph. Unchanged chunks come from the embedding cache.
+        print("HNSW index can't remove vectors; rebuilding it from cached embeddings.")
+        store, is_new_store = ChunkStore(SETTINGS_KEY, INDEX_CONFIG), True
+        changed, touched, removed = plan_corpus_changes(store, current_files)
+    elif (changed or touched or removed) and (store is live_store or store.memory_mapped):
+        # Searches keep reading the live store (and mmapped ones are read-only), so modify a
+        # private writable copy from disk and swap it in when done
+        store = (ChunkStore.load(index_dir, SETTINGS_KEY, memory_map=False, index_config=INDEX_CONFIG)
+                 or ChunkStore(SETTINGS_KEY, INDEX_CONFIG))
+        changed, touched, removed = plan_corpus_changes(store, current_files)
+
+    removed_vectors = 0
+    for source in removed:
+        removed_vectors += store.remove_file(source)
+    for source, _, file_info in touched:
+        store.files[source].update(file_info)
+
+    added_vectors = 0
+    ingest.files_total += len(changed)
+    parsed_files = iter_parsed_files(changed, CHUNK_SIZE, CHUNK_OVERLAP, INGEST_WORKERS, INGEST_PREFETCH_FILES)
+    for (source, _, file_info), texts, metadatas, vectors in embed_in_batches(parsed_files, get_embeddings().embed_documents, EMBED_BATCH_SIZE):
+        removed_vectors += store.remove_file(source)
+        added_vectors += len(store.add_file_chunks(source, file_info, texts, metadatas, vectors))
+        if len(store.docstore.pending) >= INGEST_FLUSH_CHUNKS:
+            store.flush(index_dir)
+        ingest.file_done(len(texts))
+        if progress is not None:
+            progress.update(ingest.snapshot())
+        print(f"Indexed {source}: {len(texts)} chunks.")
+
+    store.finalize() # Trains the index if this is a fresh IVF/PQ build
+    if is_new_store or changed or touched or removed:
+        store.save(index_dir)
+    if is_new_store: # Chunk IDs restart from 0, so cached rerank scores no longer match their chunks
+        reranker.clear_cache()
+    return store, {
+        "new_or_changed_files": len(changed),
+        "removed_files": len(removed),
+        "unchanged_files": len(current_files) - len(changed),
+        "vectors_added": added_vectors,
+        "vectors_removed": removed_vectors,
+    }
+
+def assign_shards(store: ShardedChunkStore, current_files: Dict[str, Path]) -> Dict[str, Dict[str, Path]]:
+    """Groups corpus files by shard key. Files already indexed unchanged keep their shard without being read."""
+    assignment: Dict[str, Dict[str, Path]] = {}
+    for source, path in current_files.items():
+        stat = path.stat()
+        key = store.shard_for_source(source, stat.st_size, stat.st_mtime_ns)
+        if key is None:
+            key = shard_key_for(extract_document_metadata(path.read_text(encoding="utf-8", errors="ignore")), SHARD_BY)
+        assignment.setdefault(key, {})[source] = path
+    return assignment
+
+def initialize_vector_store(force_rebuild: bool = False, progress: Optional[Dict[str, Any]] = None,
+                            shard: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Syncs the index with DOCS_PATH (see sync_chunk_store). With RETRIEVER_SHARD_BY set, every shard is
+    synced and swapped in on its own, so finished shards serve queries while the rest are still building;
+    `shard` limits the sync to one shard key. Ingest progress is written into `progress` as it goes.
+    """
     global vector_store
     try:
-        if not os.path.exists(DOCS_PATH) or not os.listdir(DOCS_PATH):
+        current_files = scan_corpus_files()
+        if not current_files:
             print(f"WARNING: Document directory {DOCS_PATH} is empty or does not exist.")
+        ingest = IngestProgress(0)
+        counts: Dict[str, int] = {}
+        if SHARD_BY == "none":
+            store, counts = sync_chunk_store(INDEX_DIR, vector_store, current_files, force_rebuild, ingest, progress)
+            vector_store = store if store.ntotal > 0 else None
+        else:
+            store = vector_store if isinstance(vector_store, ShardedChunkStore) else None
+            if store is None:
+                store = ShardedChunkStore.load(SHARDS_DIR, SETTINGS_KEY, index_config=INDEX_CONFIG, workers=SHARD_SEARCH_WORKERS)
+            assignment = assign_shards(store, current_files)
+            # Shards that no longer have any files are synced too, which empties them
+            shard_keys = sorted(set(assignment) | set(store.shard_numbers))
+            if shard is not None:
+                if shard not in shard_keys:
+                    raise HTTPException(status_code=404, detail=f"Unknown shard '{shard}'. Known shards: {', '.join(shard_keys)}.")
+                shard_keys = [shard]
+            for key in shard_keys:
+                shard_store, shard_counts = sync_chunk_store(
+                    store.shard_dir(key), store.shards.get(key), assignment.get(key, {}), force_rebuild, ingest, progress
+                )
+                store.set_shard(key, shard_store)
+                vector_store = store if store.ntotal > 0 else None
+                for name, value in shard_counts.items():
+                    counts[name] = counts.get(name, 0) + value
+        summary = {**counts, "total_vectors": store.ntotal, "ingest": ingest.snapshot()}
+        if SHARD_BY != "none":
+            summary["shards"] = store.stats()
+        print(f"FAISS index synced with {DOCS_PATH}: {summary}")
+        if store.ntotal == 0:
+            return {"message": "No documents found or processed. Index is empty.", **summary}
+        if not (counts.get("new_or_changed_files") or counts.get("removed_files")):
+            return {"message": "FAISS index is up to date (no document changes).", **summary}
+        return {"message": "FAISS index updated successfully.", **summary}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error initializing vector store: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to initialize vector store: {str(e)}")
+
 
-            loader = [] # No documents to load
-            documents = []
+def load_persisted_store() -> None:
+    """
+    Serves the index saved by the previous run (memory-mapped) until the models are loaded and the
+    corpus sync finishes, so a restart doesn't answer 503 for the whole sync. The sync edits its own
+    writable copy and swaps the result in.
+    """
+    global vector_store
+    if vector_store is not None:
+        return
+    try:
+        if SHARD_BY == "none":
+            store = ChunkStore.load(INDEX_DIR, SETTINGS_KEY, index_config=INDEX_CONFIG)
         else:
-            loader = DirectoryLoader(
-                DOCS_PATH,
-                glob="**/*.txt", # Load .txt files
-                loader_cls=TextLoader,
-                show_progress=True,
-                use_multithreading=True
-            )
-            documents = loader.load()
-
-        if not documents:
-            print("No documents loaded. FAISS index will be empty.")
-            pass # vector_store will remain None or be an empty store
-
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150)
-        texts = text_splitter.split_documents(documents)
-
-        if not texts:
-            print("No text chunks to index after splitting. FAISS index will effectively be empty.")
-
-            vector_store = None # Or some representation of an empty store
-            return {"message": "No documents found or processed. Index is empty."}
-
-
-        embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
-        
-        # Check if texts is not empty before creating FAISS index
-        if texts:
-            vector_store = FAISS.from_documents(texts, embeddings)
-            print("FAISS index built successfully from documents.")
-            return {"message": "FAISS index built successfully."}
+            store = ShardedChunkStore.load(SHARDS_DIR, SETTINGS_KEY, index_config=INDEX_CONFIG, workers=SHARD_SEARCH_WORKERS)
+    except Exception as e:
+        print(f"WARNING: Could not open the persisted index, searches wait for the sync: {e}")
+        return
+    if store is not None and store.ntotal > 0 and vector_store is None:
+        vector_store = store
+        print(f"Retriever Agent: Serving the persisted index ({store.ntotal} vectors) while it syncs.")
+
+def warmup_and_initialize(force_rebuild: bool = False, progress: Optional[Dict[str, Any]] = None,
+                          shard: Optional[str] = None) -> Dict[str, Any]:
+    load_persisted_store() # Before the model loads, which can take minutes on a cold start
+    warmup_embedding_model(EMBEDDING_MODEL_NAME)
+    if RERANK_BY_DEFAULT:
+        try:
+            warmup_cross_encoder(RERANK_MODEL_NAME)
+        except Exception as e:
+            print(f"WARNING: Could not load rerank model '{RERANK_MODEL_NAME}', searches will skip reranking: {e}")
+    return initialize_vector_store(force_rebuild=force_rebuild, progress=progress, shard=shard)
+
+def run_search_batch(store: ChunkStore, queries: List[str], top_k: int, mode: str = "hybrid",
+                     filters: Optional[Dict[str, Any]] = None, rerank: bool = False,
+                     deadline: Optional[float] = None) -> List[List[Dict[str, Any]]]:
+    """
+    CPU-bound part of /search and /search_batch; runs in search_pool. All queries are embedded in
+    one batched forward pass and searched with a single FAISS call over the stacked query matrix.
+    In hybrid mode the vector and BM25 candidate lists are merged with reciprocal-rank fusion.
+    Filters are resolved once against the metadata index; both sides only score the allowed IDs.
+    With rerank, the top RERANK_CANDIDATES are rescored by the cross-encoder while `deadline`
+    (time.monotonic()) allows; reranked hits carry a "rerank_score".
+    """
+    store = store.snapshot() # Filter, search and chunk lookups must all see the same shard set
+    allowed_ids = store.filter_ids(filters)
+    if allowed_ids is not None and not allowed_ids:
+        return [[] for _ in queries]
+    first_stage_k = max(top_k, RERANK_CANDIDATES) if rerank else top_k
+    candidate_k = max(first_stage_k, top_k * HYBRID_CANDIDATES_PER_SIDE) if mode == "hybrid" else first_stage_k
+    vector_rankings = [[] for _ in queries]
+    lexical_rankings = [[] for _ in queries]
+    if mode in ("hybrid", "vector"):
+        query_vectors = np.array(get_embeddings().embed_queries(queries), dtype="float32")
+        vector_rankings = [[chunk_id for chunk_id, _ in hits] for hits in store.search(query_vectors, candidate_k, allowed_ids=allowed_ids)]
+    if mode in ("hybrid", "lexical"):
+        lexical_rankings = [[chunk_id for chunk_id, _ in store.lexical_search(query, candidate_k, allowed_ids)] for query in queries]
+
+    results = []
+    for query, vector_ranking, lexical_ranking in zip(queries, vector_rankings, lexical_rankings):
+        if mode == "hybrid":
+            ranked_ids = [chunk_id for chunk_id, _ in reciprocal_rank_fusion([vector_ranking, lexical_ranking], first_stage_k)]
         else:
-            print("No text chunks available to build FAISS index.")
+            ranked_ids = (vector_ranking or lexical_ranking)[:first_stage_k]
+        chunks = {chunk_id: store.get_chunk(chunk_id) for chunk_id in ranked_ids}
+        ranked_ids = [chunk_id for chunk_id in ranked_ids if chunks[chunk_id]]
+        rerank_scores = {}
+        if rerank:
+            reranked = reranker.rerank(query, [(chunk_id, chunks[chunk_id]["page_content"]) for chunk_id in ranked_ids], top_k, deadline)
+            if reranked is not None:
+                ranked_ids, rerank_scores = [chunk_id for chunk_id, _ in reranked], dict(reranked)
+        results.append([
+            {"page_content": chunks[chunk_id]["page_content"], "metadata": chunks[chunk_id]["metadata"],
+             **({"rerank_score": rerank_scores[chunk_id]} if chunk_id in rerank_scores else {})}
+            for chunk_id in ranked_ids[:top_k]
+        ])
+    return results
 
-            vector_store = None # Explicitly state it's not built with data
-            return {"message": "No text chunks to index. Index is empty."}
+def run_search(store: ChunkStore, query: str, top_k: int, mode: str = "hybrid", filters: Optional[Dict[str, Any]] = None,
+               rerank: bool = False, deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    return run_search_batch(store, [query], top_k, mode, filters, rerank, deadline)[0]
 
+def validate_search_mode(mode: Optional[str]) -> str:
+    mode = (mode or DEFAULT_SEARCH_MODE).lower()
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown search mode '{mode}'. Use one of: {', '.join(SEARCH_MODES)}.")
+    return mode
+
+def run_recall_evaluation(store: ChunkStore, k: int, sample_size: int, queries: Optional[List[str]],
+                          nprobe: Optional[int], ef_search: Optional[int]) -> Dict[str, Any]:
+    """
+    Recall@k of the configured index against exact search. Chunk vectors come from the embedding
+    cache, so this doesn't re-run the model. Without explicit queries, sampled chunks are used as queries.
+    """
+    store = store.snapshot()
+    chunk_ids = np.array(sorted(store.chunk_ids()), dtype="int64")
+    texts = [store.get_chunk(int(chunk_id))["page_content"] for chunk_id in chunk_ids]
+    exact_vectors = np.array(get_embeddings().embed_documents(texts), dtype="float32")
+    if queries:
+        query_vectors = np.array(get_embeddings().embed_queries(queries), dtype="float32")
+    else:
+        sample = np.random.default_rng().choice(len(chunk_ids), min(sample_size, len(chunk_ids)), replace=False)
+        query_vectors = exact_vectors[sample]
+    return store.evaluate_recall(query_vectors, chunk_ids, exact_vectors, k, nprobe=nprobe, ef_search=ef_search)
+
+def get_active_build_job() -> Optional[Dict[str, Any]]:
+    for job in build_jobs.values():
+        if job["status"] in ("queued", "running"):
+            return job
+    return None
+
+async def run_build_job(job: Dict[str, Any]) -> None:
+    job["status"] = "running"
+    job["started_at"] = datetime.utcnow().isoformat()
+    try:
+        job["result"] = await build_pool.run(warmup_and_initialize, job["force"], job["progress"], job["shard"])
+        job["status"] = "succeeded"
+    except HTTPException as e:
+        job["status"], job["error"] = "failed", e.detail
     except Exception as e:
-        print(f"Error initializing vector store: {e}")
-        vector_store = None # Ensure it's None on error
-        raise HTTPException(status_code=500, detail=f"Failed to initialize vector store: {str(e)}")
+        job["status"], job["error"] = "failed", str(e)
+    job["finished_at"] = datetime.utcnow().isoformat()
+    print(f"Retriever Agent: Build job {job['job_id']} {job['status']}.")
+
+def start_build_job(force_rebuild: bool = False, shard: Optional[str] = None) -> Dict[str, Any]:
+    """Starts an index build in the background, or returns the build that is already in progress."""
+    active_job = get_active_build_job()
+    if active_job is not None:
+        return active_job
+    job = {"job_id": uuid.uuid4().hex, "status": "queued", "force": force_rebuild, "shard": shard,
+           "created_at": datetime.utcnow().isoformat(), "started_at": None, "finished_at": None,
+           "progress": {}, "result": None, "error": None}
+    build_jobs[job["job_id"]] = job
+    while len(build_jobs) > MAX_BUILD_JOB_HISTORY:
+        build_jobs.pop(next(iter(build_jobs)))
+    job["task"] = asyncio.ensure_future(run_build_job(job))
+    return job
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in job.items() if key != "task"}
 
 
 app = FastAPI()
 
 @app.on_event("startup")
 async def startup_event():
-    print("Retriever Agent starting up. Initializing vector store...")
-    try:
-        # initialize_vector_store()
-        if vector_store:
-            print("Vector store initialized successfully on startup.")
-        else:
-            print("Vector store could not be initialized with data on startup (e.g. no documents found).")
-    except Exception as e:
-        print(f"Startup error during vector store initialization: {e}")
+    print("Retriever Agent starting up. Loading embedding model and initializing vector store in the background...")
+    # The persisted index is served as soon as it is opened; the sync that follows is cheap when it
+    # matches the corpus, only new or changed documents are embedded.
+    # Runs as a build job so startup (and every other mounted agent) isn't blocked; see /status.
+    start_build_job()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    search_pool.shutdown()
+    build_pool.shutdown()
+    fallback_pool.shutdown()
+    if isinstance(vector_store, ShardedChunkStore):
+        vector_store.shutdown()
+
+class SearchFilters(BaseModel):
+    """All given fields must match; list fields match any of their values. Dates are inclusive."""
+    sources: Optional[List[str]] = None # Paths relative to the docs directory, e.g. "tsmc_earnings_q1_2025.txt"
+    tickers: Optional[List[str]] = None # e.g. ["TSM", "005930.KS"]
+    regions: Optional[List[str]] = None # Portfolio regions, e.g. ["Asia"]
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
 
 class QueryRequest(BaseModel):
     query: str
     top_k: int = 3
+    mode: Optional[str] = None # "hybrid", "vector" or "lexical"; defaults to RETRIEVER_SEARCH_MODE
+    filters: Optional[SearchFilters] = None
+    rerank: Optional[bool] = None             # Defaults to RETRIEVER_RERANK
+    rerank_budget_ms: Optional[float] = None  # Defaults to RETRIEVER_RERANK_BUDGET_MS
 
-@app.post("/build_index")
-async def build_index_endpoint():
-    """Manually trigger building or rebuilding the FAISS index."""
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 3
+    mode: Optional[str] = None
+    filters: Optional[SearchFilters] = None # Applied to every query in the batch
+    rerank: Optional[bool] = None # No latency budget for batches: every query is reranked
+
+class RecallEvaluationRequest(BaseModel):
+    k: int = 10
+    sample_size: int = 100 # Chunks sampled as queries when no queries are given
+    queries: Optional[List[str]] = None
+    nprobe: Optional[int] = None    # Override RETRIEVER_NPROBE for this run (IVF)
+    ef_search: Optional[int] = None # Override RETRIEVER_EF_SEARCH for this run (HNSW)
+
+@app.get("/status")
+async def retriever_status():
+    """Readiness of the embedding model and the index. /search needs both."""
+    model_status = embedding_model_status(EMBEDDING_MODEL_NAME)
+    active_job = get_active_build_job()
+    return {
+        "ready": model_status == MODEL_READY and vector_store is not None,
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "embedding_model_status": model_status,
+        "index_loaded": vector_store is not None,
+        "total_vectors": vector_store.ntotal if vector_store is not None else 0,
+        "index_type": INDEX_CONFIG["index_type"],
+        "vector_encoding": INDEX_CONFIG["vector_encoding"],
+        "index_description": vector_store.index_description if vector_store is not None else None,
+        "shard_by": SHARD_BY,
+        "shards": vector_store.stats() if isinstance(vector_store, ShardedChunkStore) else None,
+        "active_build_job": public_job(active_job) if active_job else None,
+        "search_pool": search_pool.stats(),
+        "fallback_pool": fallback_pool.stats(),
+        "reranker": reranker.stats(),
+        "embedding_cache": embeddings.stats() if embeddings is not None else None
+    }
+
+@app.post("/build_index", status_code=202)
+async def build_index_endpoint(force: bool = False, wait: bool = False, shard: Optional[str] = None):
+    """
+    Sync the FAISS index with the document directory (incremental), or rebuild it from scratch with force=true.
+    Runs as a background job; poll GET /build_index/{job_id}, or pass wait=true to block until it finishes.
+    With RETRIEVER_SHARD_BY set, shard=<key> syncs (or with force=true rebuilds) only that shard.
+    """
+    if shard is not None and SHARD_BY == "none":
+        raise HTTPException(status_code=400, detail="The index is not sharded (RETRIEVER_SHARD_BY is 'none').")
     try:
-        result = initialize_vector_store()
-        return result
-    except HTTPException as e: # Catch HTTPExceptions from initialize_vector_store
+        job = start_build_job(force_rebuild=force, shard=shard)
+        if wait:
+            await asyncio.shield(job["task"])
+        return public_job(job)
+    except HTTPException as e:
         raise e
     except Exception as e: # Catch any other unexpected errors
         raise HTTPException(status_code=500, detail=f"Failed to build index: {str(e)}")
 
+@app.get("/build_index/{job_id}")
+async def build_job_status(job_id: str):
+    job = build_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown build job {job_id}.")
+    return public_job(job)
+
+async def run_lexical_fallback(store, query: str, top_k: int, filters: Optional[Dict[str, Any]], busy_detail: str) -> Dict[str, Any]:
+    try:
+        results = await fallback_pool.run(run_search, store, query, top_k, "lexical", filters)
+    except PoolSaturated:
+        raise HTTPException(status_code=503, detail=busy_detail)
+    return {"results": results, "retrieval_mode": "lexical_fallback"}
+
 @app.post("/search")
-async def search_documents(request: QueryRequest, current_vector_store: FAISS = Depends(get_vector_store)):
+async def search_documents(request: QueryRequest, current_vector_store: ChunkStore = Depends(get_vector_store)):
     """Search for relevant documents based on a query."""
     if current_vector_store is None: # Double check, though Depends(get_vector_store) should handle it
         raise HTTPException(status_code=503, detail="Vector store not available or empty. Try calling /build_index.")
+    mode = validate_search_mode(request.mode)
+    filters = request.filters.model_dump(exclude_none=True) if request.filters else None
+    rerank = RERANK_BY_DEFAULT if request.rerank is None else request.rerank
+    # The budget covers queueing for a search worker too, so a busy retriever skips reranking first
+    deadline = time.monotonic() + (request.rerank_budget_ms or RERANK_BUDGET_MS) / 1000
     try:
-        docs = current_vector_store.similarity_search(request.query, k=request.top_k)
-        return {"results": [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs]}
+        if mode != "lexical" and embedding_model_status(EMBEDDING_MODEL_NAME) == MODEL_LOADING:
+            if not LEXICAL_FALLBACK:
+                raise HTTPException(status_code=503, detail="Embedding model is still loading. Check /status.")
+            return await run_lexical_fallback(current_vector_store, request.query, request.top_k, filters,
+                                              "Embedding model is still loading and the lexical fallback is busy. Check /status.")
+        try:
+            results = await search_pool.run(run_search, current_vector_store, request.query, request.top_k, mode, filters, rerank, deadline)
+            return {"results": results, "retrieval_mode": mode, "reranked": bool(results) and "rerank_score" in results[0]}
+        except PoolSaturated as e:
+            if not LEXICAL_FALLBACK:
+                raise HTTPException(status_code=503, detail=f"Retriever is busy, try again shortly: {str(e)}")
+            # BM25 needs no embedding, so a small separate pool can still answer under load
+            return await run_lexical_fallback(current_vector_store, request.query, request.top_k, filters,
+                                              f"Retriever is busy, try again shortly: {str(e)}")
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error during search: {str(e)}")
+
+@app.post("/search_batch")
+async def search_documents_batch(request: BatchQueryRequest, current_vector_store: ChunkStore = Depends(get_vector_store)):
+    """Search many queries at once (backtests, evaluation sweeps). results[i] holds the hits for queries[i]."""
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="No queries provided.")
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"Too many queries: {len(request.queries)} (max {MAX_BATCH_QUERIES}).")
+    mode = validate_search_mode(request.mode)
+    if mode != "lexical" and embedding_model_status(EMBEDDING_MODEL_NAME) == MODEL_LOADING:
+        raise HTTPException(status_code=503, detail="Embedding model is still loading. Check /status.")
+    filters = request.filters.model_dump(exclude_none=True) if request.filters else None
+    rerank = RERANK_BY_DEFAULT if request.rerank is None else request.rerank
+    try:
+        results = await search_pool.run(run_search_batch, current_vector_store, request.queries, request.top_k, mode, filters, rerank)
+        return {"results": results, "retrieval_mode": mode}
+    except PoolSaturated as e:
+        raise HTTPException(status_code=503, detail=f"Retriever is busy, try again shortly: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error during batch search: {str(e)}")
+
+@app.post("/evaluate_recall")
+async def evaluate_recall(request: RecallEvaluationRequest, current_vector_store: ChunkStore = Depends(get_vector_store)):
+    """Report recall@k and per-query latency of the configured index vs. exact search, e.g. to tune nprobe/efSearch."""
+    if request.sample_size > MAX_RECALL_SAMPLE_SIZE or len(request.queries or []) > MAX_RECALL_SAMPLE_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_RECALL_SAMPLE_SIZE} evaluation queries.")
+    try:
+        # Holds every chunk vector in memory for the exact baseline, so it runs on the single build worker
+        return await build_pool.run(
+            run_recall_evaluation, current_vector_store, request.k, request.sample_size,
+            request.queries, request.nprobe, request.ef_search
+        )
+    except PoolSaturated as e:
+        raise HTTPException(status_code=503, detail=f"Index build in progress, try again shortly: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error during recall evaluation: {str(e)}")
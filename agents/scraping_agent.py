@@ -2,6 +2,7 @@ import os
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, HttpUrl
 import httpx
+from http_clients import get_http_client
 from typing import List, Optional
 import asyncio
 from dotenv import load_dotenv
@@ -105,32 +106,32 @@ async def scrape_news_and_summarize(request: ScrapeRequest):
     if not request.query:
         raise HTTPException(status_code=400, detail="A search query must be provided.")
 
-    async with httpx.AsyncClient() as client:
-        initial_articles = await fetch_initial_news_list(request.query, request.results_limit, client)
+    client = get_http_client("scrapingdog")
+    initial_articles = await fetch_initial_news_list(request.query, request.results_limit, client)
 
-        if not initial_articles:
-            print(f"ScrapingAgent: No initial articles found for query '{request.query}'. Returning empty list.")
-            return []
+    if not initial_articles:
+        print(f"ScrapingAgent: No initial articles found for query '{request.query}'. Returning empty list.")
+        return []
 
-        articles_to_summarize = initial_articles[:request.summary_limit]
-        
-        print(f"ScrapingAgent: Attempting to summarize top {len(articles_to_summarize)} articles.")
-
-        summary_tasks = []
-        for article_stub in articles_to_summarize:
-            summary_tasks.append(fetch_article_summary(str(article_stub.url), client)) # Ensure URL is string
-
-        summaries = await asyncio.gather(*summary_tasks)
-
-        final_articles: List[SummarizedNewsArticle] = []
-        for i, article_stub in enumerate(articles_to_summarize):
-            summary_content = summaries[i] # This will be None if summarization failed
-            summarized_article = SummarizedNewsArticle(
-                **article_stub.model_dump(), # Spread fields from InitialNewsArticle
-                summary=summary_content
-            )
-            final_articles.append(summarized_article)
-        
+    articles_to_summarize = initial_articles[:request.summary_limit]
+    
+    print(f"ScrapingAgent: Attempting to summarize top {len(articles_to_summarize)} articles.")
+
+    summary_tasks = []
+    for article_stub in articles_to_summarize:
+        summary_tasks.append(fetch_article_summary(str(article_stub.url), client)) # Ensure URL is string
+
+    summaries = await asyncio.gather(*summary_tasks)
+
+    final_articles: List[SummarizedNewsArticle] = []
+    for i, article_stub in enumerate(articles_to_summarize):
+        summary_content = summaries[i] # This will be None if summarization failed
+        summarized_article = SummarizedNewsArticle(
+            **article_stub.model_dump(), # Spread fields from InitialNewsArticle
+            summary=summary_content
+        )
+        final_articles.append(summarized_article)
+    
 
-        print(f"ScrapingAgent: Processed {len(final_articles)} articles for query '{request.query}'.")
-        return final_articles
+    print(f"ScrapingAgent: Processed {len(final_articles)} articles for query '{request.query}'.")
+    return final_articles
@@ -0,0 +1,169 @@
+# /agents/sharded_store.py
+# Several ChunkStores (one per shard, e.g. per year or region) searched in parallel and merged with a heap.
+import os
+import re
+import copy
+import json
+import heapq
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
+from chunk_store import ChunkStore, DEFAULT_INDEX_CONFIG
+
+SHARD_KEYS = ("none", "year", "region")
+SHARDS_FILE = "shards.json" # Shard key -> shard number; numbers are never reused
+SHARD_ID_STRIDE = 1 << 40   # Global chunk ID = shard number * stride + the shard's own chunk ID
+
+
+def shard_key_for(metadata: Dict[str, Any], shard_by: str) -> str:
+    """Shard a document belongs to. Documents tagged with several regions go to the first one alphabetically."""
+    if shard_by == "year":
+        key = (metadata.get("date") or "")[:4] or "undated"
+    else:
+        key = (metadata.get("regions") or ["global"])[0]
+    return re.sub(r"[^a-z0-9]+", "_", key.lower()).strip("_") # Used as a directory name
+
+
+class ShardedChunkStore:
+    """
+    Same search interface as ChunkStore over a set of independent shards. Each shard is a complete
+    ChunkStore in its own directory, so one shard can be rebuilt and swapped in (set_shard) while
+    queries keep running against the others. Queries fan out to every shard in a thread pool and the
+    per-shard top-k lists are merged with a heap. Chunk IDs are made global by prefixing the shard number.
+    A rebuilt shard restarts its local IDs, so callers that search and then fetch chunks must do both
+    on one snapshot(); otherwise a swap in between could resolve an ID to a different chunk.
+    """
+
+    def __init__(self, root_dir: str, settings_key: str, index_config: Optional[Dict[str, Any]] = None, workers: int = 4):
+        self.root_dir = root_dir
+        self.settings_key = settings_key
+        self.index_config = {**DEFAULT_INDEX_CONFIG, **(index_config or {})}
+        self.shards: Dict[str, ChunkStore] = {}
+        self.shard_numbers: Dict[str, int] = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="retriever-shard")
+        numbers_path = os.path.join(root_dir, SHARDS_FILE)
+        if os.path.exists(numbers_path):
+            with open(numbers_path, "r", encoding="utf-8") as f:
+                self.shard_numbers = json.load(f)
+
+    @classmethod
+    def load(cls, root_dir: str, settings_key: str, index_config: Optional[Dict[str, Any]] = None,
+             workers: int = 4) -> "ShardedChunkStore":
+        """Opens every persisted shard built with the same settings; the others are left to be rebuilt."""
+        store = cls(root_dir, settings_key, index_config, workers)
+        for key in store.shard_numbers:
+            shard = ChunkStore.load(store.shard_dir(key), settings_key, index_config=index_config)
+            if shard is not None and shard.ntotal > 0:
+                store.shards[key] = shard
+        return store
+
+    def shard_dir(self, key: str) -> str:
+        return os.path.join(self.root_dir, key)
+
+    def shard_number(self, key: str) -> int:
+        if key not in self.shard_numbers:
+            self.shard_numbers[key] = max(self.shard_numbers.values(), default=-1) + 1
+            os.makedirs(self.root_dir, exist_ok=True)
+            with open(os.path.join(self.root_dir, SHARDS_FILE + ".tmp"), "w", encoding="utf-8") as f:
+                json.dump(self.shard_numbers, f)
+            os.replace(os.path.join(self.root_dir, SHARDS_FILE + ".tmp"), os.path.join(self.root_dir, SHARDS_FILE))
+        return self.shard_numbers[key]
+
+    def set_shard(self, key: str, shard: Optional[ChunkStore]) -> None:
+        """Swaps one shard in (or out, with None). Searches running on a snapshot() keep the shard set they started with."""
+        self.shard_number(key)
+        shards = dict(self.shards)
+        if shard is None or shard.ntotal == 0:
+            shards.pop(key, None)
+        else:
+            shards[key] = shard
+        self.shards = shards
+
+    def shard_for_source(self, source: str, size: int, mtime_ns: int) -> Optional[str]:
+        """Key of the shard already holding this exact file version, so unchanged files needn't be re-read."""
+        for key, shard in self.shards.items():
+            entry = shard.files.get(source)
+            if entry and entry["size"] == size and entry["mtime_ns"] == mtime_ns:
+                return key
+        return None
+
+    def snapshot(self) -> "ShardedChunkStore":
+        """Read-only view of the current shard set (sharing the thread pool); set_shard on the live store doesn't affect it."""
+        view = copy.copy(self)
+        view.shards = self.shards # set_shard replaces this dict rather than mutating it
+        view.shard_numbers = dict(self.shard_numbers)
+        return view
+
+    def _shard_items(self):
+        return [(self.shard_numbers[key] * SHARD_ID_STRIDE, shard) for key, shard in self.shards.items()]
+
+    @staticmethod
+    def _local_ids(allowed_ids: Optional[Set[int]], offset: int) -> Optional[Set[int]]:
+        if allowed_ids is None:
+            return None
+        return {chunk_id - offset for chunk_id in allowed_ids if offset <= chunk_id < offset + SHARD_ID_STRIDE}
+
+    @property
+    def ntotal(self) -> int:
+        return sum(shard.ntotal for shard in self.shards.values())
+
+    @property
+    def index_description(self) -> str:
+        return ", ".join(sorted({shard.index_description for shard in self.shards.values() if shard.index_description}))
+
+    def stats(self) -> Dict[str, int]:
+        return {key: shard.ntotal for key, shard in sorted(self.shards.items())}
+
+    def filter_ids(self, filters: Optional[Dict[str, Any]]) -> Optional[Set[int]]:
+        if not filters:
+            return None
+        allowed: Set[int] = set()
+        for offset, shard in self._shard_items():
+            allowed.update(offset + chunk_id for chunk_id in shard.filter_ids(filters))
+        return allowed
+
+    def _fan_out(self, search_shard) -> List[Any]:
+        """Runs search_shard(offset, shard) on every shard in parallel; shards ruled out by a filter return None."""
+        return [result for result in self._executor.map(lambda item: search_shard(*item), self._shard_items()) if result is not None]
+
+    def search(self, query_vectors: np.ndarray, k: int, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+               allowed_ids: Optional[Set[int]] = None) -> List[List[Tuple[int, float]]]:
+        def search_shard(offset, shard):
+            local_ids = self._local_ids(allowed_ids, offset)
+            if local_ids is not None and not local_ids:
+                return None
+            hits = shard.search(query_vectors, k, nprobe=nprobe, ef_search=ef_search, allowed_ids=local_ids)
+            return [[(offset + chunk_id, distance) for chunk_id, distance in row] for row in hits]
+
+        per_shard = self._fan_out(search_shard)
+        return [
+            list(itertools.islice(heapq.merge(*rows, key=lambda hit: hit[1]), k))
+            for rows in zip(*per_shard)
+        ] if per_shard else [[] for _ in range(len(query_vectors))]
+
+    def lexical_search(self, query: str, k: int, allowed_ids: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        """BM25 per shard (each with its own IDF statistics), merged by score."""
+        def search_shard(offset, shard):
+            local_ids = self._local_ids(allowed_ids, offset)
+            if local_ids is not None and not local_ids:
+                return None
+            return [(offset + chunk_id, score) for chunk_id, score in shard.lexical_search(query, k, local_ids)]
+
+        return list(itertools.islice(heapq.merge(*self._fan_out(search_shard), key=lambda hit: -hit[1]), k))
+
+    def get_chunk(self, chunk_id: int) -> Optional[Dict[str, Any]]:
+        shard_number, local_id = divmod(chunk_id, SHARD_ID_STRIDE)
+        for key, shard in self.shards.items():
+            if self.shard_numbers[key] == shard_number:
+                return shard.get_chunk(local_id)
+        return None
+
+    def chunk_ids(self) -> List[int]:
+        return [offset + chunk_id for offset, shard in self._shard_items() for chunk_id in shard.chunk_ids()]
+
+    # Same exact-vs-index comparison as a single store; search() above does the fan-out
+    evaluate_recall = ChunkStore.evaluate_recall
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
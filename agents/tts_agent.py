@@ -2,6 +2,7 @@
 import os
 import re
 import httpx # Using httpx for async consistency with other agents
+from http_clients import get_http_client
 from fastapi import FastAPI, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
@@ -74,12 +75,10 @@ async def synthesize_speech_endpoint(request: TTSRequest):
         return StreamingResponse(empty_generator(), media_type="audio/mpeg")
 
 
-    client = httpx.AsyncClient()
     async def audio_stream_generator():
-        # This new client will be used by the generator
-        async with httpx.AsyncClient() as stream_client:
-            async for chunk in stream_audio_segments(segments, stream_client):
-                yield chunk
+        stream_client = get_http_client("deepgram")
+        async for chunk in stream_audio_segments(segments, stream_client):
+            yield chunk
         print("TTS Agent: Finished streaming all audio segments.")
 
     return StreamingResponse(audio_stream_generator(), media_type="audio/mpeg")
@@ -0,0 +1,51 @@
+# /agents/worker_pools.py
+# Bounded thread pools for CPU-bound work (embedding, FAISS, blocking SDK calls) so it never runs on the event loop.
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class BoundedExecutor:
+    """
+    Thread pool with at most max_workers running and max_queued waiting tasks. Submitting beyond
+    that raises PoolSaturated right away, so callers can shed load (e.g. 503) instead of piling up.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queued: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_queued
+        self.in_flight = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        if self.in_flight >= self.capacity:
+            raise PoolSaturated(f"{self.name} pool is saturated ({self.in_flight} tasks in flight).")
+        # Only the event loop thread touches in_flight, so no lock is needed
+        loop = asyncio.get_running_loop()
+        future = self._executor.submit(functools.partial(fn, *args, **kwargs))
+        self.in_flight += 1
+        # Released when the work itself is done (or cancelled before it started), not when the caller
+        # stops waiting: a cancelled caller leaves its thread running, still occupying the pool
+        future.add_done_callback(lambda _: self._release(loop))
+        return await asyncio.wrap_future(future)
+
+    def _release(self, loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            loop.call_soon_threadsafe(self._decrement)
+        except RuntimeError: # Loop already closed at shutdown
+            pass
+
+    def _decrement(self) -> None:
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {"workers": self.max_workers, "capacity": self.capacity, "in_flight": self.in_flight}
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
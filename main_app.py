@@ -1,6 +1,7 @@
 # main_app.py
 import os
 import sys
+import asyncio
 from pathlib import Path
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -70,6 +71,34 @@ app = FastAPI(
     version="1.0.0"
 )
 
+MOUNTED_APPS = [api_app, language_app, retriever_app, scraping_app, stt_app, tts_app, orchestrator_app]
+
+async def run_event_handlers(handlers):
+    for handler in handlers:
+        try:
+            result = handler()
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception as e:
+            print(f"❌ Error in event handler {getattr(handler, '__name__', handler)}: {e}")
+
+@app.on_event("startup")
+async def startup_event():
+    """Mounted sub-apps don't receive lifespan events, so run their startup handlers (e.g. model warmup) here"""
+    for sub_app in MOUNTED_APPS:
+        await run_event_handlers(sub_app.router.on_startup)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Run sub-app shutdown handlers, then close the pooled upstream HTTP clients shared by all agents"""
+    for sub_app in MOUNTED_APPS:
+        await run_event_handlers(sub_app.router.on_shutdown)
+    try:
+        from http_clients import close_http_clients
+        await close_http_clients()
+    except Exception as e:
+        print(f"❌ Failed to close HTTP clients: {e}")
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -88,6 +117,13 @@ app.mount("/stt", stt_app)
 app.mount("/tts", tts_app)
 app.mount("/orchestrator", orchestrator_app)
 
+# Route orchestrator -> agent calls through this app in-process instead of the public URL
+try:
+    from orchestrator import register_local_agents
+    register_local_agents(app)
+except Exception as e:
+    print(f"❌ Failed to register in-process agent transport: {e}")
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
@@ -118,21 +154,29 @@ async def list_endpoints():
         "API Agent (Stock Data)": {
             "base_path": "/api",
             "endpoints": [
-                "GET /stock/{symbol} - Get stock data for a symbol"
+                "GET /stock/{symbol} - Get stock data for a symbol",
+                "POST /stock/batch - Get stock data for many symbols",
+                "GET /rate_limit_status - AlphaVantage quota usage"
             ]
         },
         "Language Agent (LLM Processing)": {
             "base_path": "/language",
             "endpoints": [
                 "POST /generate_keywords - Generate search keywords",
-                "POST /synthesize - Synthesize narrative from context"
+                "POST /synthesize - Synthesize narrative from context",
+                "POST /synthesize_stream - Stream the narrative as NDJSON tokens",
+                "GET /response_cache - Response cache stats (DELETE clears it)"
             ]
         },
         "Retriever Agent (RAG/Vector Search)": {
             "base_path": "/retriever", 
             "endpoints": [
-                "POST /build_index - Build/rebuild FAISS index",
-                "POST /search - Search documents"
+                "POST /build_index - Build/rebuild FAISS index (background job)",
+                "GET /build_index/{job_id} - Build job status",
+                "GET /status - Embedding model and index readiness",
+                "POST /search - Search documents",
+                "POST /search_batch - Search many queries in one call",
+                "POST /evaluate_recall - Recall@k of the index vs. exact search"
             ]
         },
         "Scraping Agent (News Scraping)": {
@@ -3,34 +3,75 @@ from fastapi import FastAPI, HTTPException, UploadFile, File
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import httpx
+from http_clients import get_http_client, TimeoutASGITransport
+from portfolio_summary import parse_portfolio_csv, summarize_portfolio
 from typing import List, Optional, Dict, Any
 import base64
+import asyncio
 from pathlib import Path
 
 app = FastAPI()
 
-# Updated URLs to use the single port with different endpoints
-BASE_URL = "https://finvoiceagent.onrender.com"
-RETRIEVER_AGENT_URL = f"{BASE_URL}/retriever"
-LANGUAGE_AGENT_URL = f"{BASE_URL}/language"
-SCRAPING_AGENT_URL = f"{BASE_URL}/scraping"
-STT_AGENT_URL = f"{BASE_URL}/stt"
-TTS_AGENT_URL = f"{BASE_URL}/tts"
+# Agent transport: "asgi" dispatches to the agent apps mounted in this process (see main_app.py),
+# "http" goes over the network to AGENT_BASE_URL for split deployments.
+AGENT_TRANSPORT = os.getenv("AGENT_TRANSPORT", "asgi").lower()
+BASE_URL = os.getenv("AGENT_BASE_URL", "https://finvoiceagent.onrender.com")
+LOCAL_BASE_URL = "http://agents.local" # Placeholder host, never resolved for in-process calls
+
+# Agent paths are relative to the client's base_url
+RETRIEVER_AGENT_URL = "/retriever"
+LANGUAGE_AGENT_URL = "/language"
+SCRAPING_AGENT_URL = "/scraping"
+STT_AGENT_URL = "/stt"
+TTS_AGENT_URL = "/tts"
+
+local_agents_app = None # Set by main_app once every agent is mounted
+_warned_no_local_app = False
+
+def register_local_agents(asgi_app) -> None:
+    """Lets the orchestrator call agents mounted on asgi_app without leaving the process."""
+    global local_agents_app
+    local_agents_app = asgi_app
+    print(f"Orchestrator: Registered in-process agent app. Transport: {AGENT_TRANSPORT}")
+
+def get_agent_client() -> httpx.AsyncClient:
+    """Returns the shared client for agent calls. It is pooled, so callers must not close it."""
+    global _warned_no_local_app
+    if AGENT_TRANSPORT == "asgi" and local_agents_app is not None:
+        # Enforces the per-call timeouts below, which the plain ASGI transport would silently drop
+        return get_http_client("agents_local", transport=TimeoutASGITransport(app=local_agents_app), base_url=LOCAL_BASE_URL)
+    if AGENT_TRANSPORT == "asgi" and not _warned_no_local_app:
+        _warned_no_local_app = True
+        print("Orchestrator: No in-process agent app registered, falling back to HTTP transport.")
+    return get_http_client("agents_remote", base_url=BASE_URL)
 
 PORTFOLIO_CSV_PATH = Path(__file__).resolve().parent.parent / "data_ingestion" / "mock_portfolio_multi_day_real_companies.csv"
 
+# Parsed holdings, re-read only when the CSV's size or mtime changes
+_portfolio_rows_cache: Dict[str, Any] = {"version": None, "rows": []}
 
-def read_portfolio_csv() -> Optional[str]:
+
+def load_portfolio_rows() -> List[Dict[str, Any]]:
     try:
-        if os.path.exists(PORTFOLIO_CSV_PATH):
-            with open(PORTFOLIO_CSV_PATH, 'r', encoding='utf-8') as f: 
-                return f.read()
-        else: 
+        if not os.path.exists(PORTFOLIO_CSV_PATH):
             print(f"Orchestrator: Portfolio CSV file not found at {PORTFOLIO_CSV_PATH}")
-            return None
-    except Exception as e: 
+            return []
+        stat = PORTFOLIO_CSV_PATH.stat()
+        version = (stat.st_size, stat.st_mtime_ns)
+        if _portfolio_rows_cache["version"] != version:
+            with open(PORTFOLIO_CSV_PATH, 'r', encoding='utf-8') as f:
+                _portfolio_rows_cache["rows"] = parse_portfolio_csv(f.read())
+            _portfolio_rows_cache["version"] = version
+        return _portfolio_rows_cache["rows"]
+    except Exception as e:
         print(f"Orchestrator: Error reading portfolio CSV: {str(e)}")
-        return None
+        return []
+
+
+def get_portfolio_summary(user_query: str) -> Optional[Dict[str, Any]]:
+    """Latest-day AUM, allocations and query-relevant positions; sent to the language agent instead of the raw CSV."""
+    return summarize_portfolio(load_portfolio_rows(), user_query) or None
+
 
 class ChatMessage(BaseModel):
     role: str
@@ -61,88 +102,111 @@ async def get_news_search_keywords_from_llm(user_query: str, client: httpx.Async
     except: 
         return user_query
 
+async def scrape_news_for_query(user_query: str, client: httpx.AsyncClient) -> List[ArticleDataForLLM]:
+    # Keyword generation feeds the scraper, so these two stages stay sequential.
+    scraper_search_term = await get_news_search_keywords_from_llm(user_query, client)
+    summarized_articles_for_llm: List[ArticleDataForLLM] = []
+    try:
+        scraper_payload = {"query": scraper_search_term, "results_limit": 5, "summary_limit": 3}
+        response_scraper = await client.post(f"{SCRAPING_AGENT_URL}/scrape_summarized_news", json=scraper_payload, timeout=120.0)
+        response_scraper.raise_for_status()
+        scraped_data_list = response_scraper.json()
+        for article_data in scraped_data_list: 
+            summarized_articles_for_llm.append(ArticleDataForLLM(**article_data))
+        print(f"Orchestrator: Scraped {len(summarized_articles_for_llm)} articles.")
+    except Exception as e: 
+        print(f"Orchestrator: Error in scraping step: {str(e)}")
+    return summarized_articles_for_llm
+
+def rag_filters_for(portfolio_summary: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Narrows retrieval to the holdings the query names (the summary's "focus" tickers), e.g. {"tickers": ["TSM"]}."""
+    tickers = ((portfolio_summary or {}).get("focus") or {}).get("tickers")
+    return {"tickers": tickers} if tickers else None
+
+async def retrieve_rag_chunks(user_query: str, client: httpx.AsyncClient, filters: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    filters narrows the search by sources/tickers/regions/date_from/date_to, e.g. {"tickers": ["TSM"], "date_from": "2025-04-01"}.
+    When nothing matches them (e.g. no document mentions the ticker), the query is searched again unfiltered.
+    """
+    retrieved_rag_chunks: List[str] = []
+    try:
+        for search_filters in ([filters, None] if filters else [None]):
+            retriever_payload = {"query": user_query, "top_k": 2}
+            if search_filters:
+                retriever_payload["filters"] = search_filters
+            response_retriever = await client.post(f"{RETRIEVER_AGENT_URL}/search", json=retriever_payload, timeout=20.0)
+            response_retriever.raise_for_status()
+            retrieved_data = response_retriever.json()
+            retrieved_rag_chunks = [item.get("page_content", "") for item in retrieved_data.get("results", [])]
+            if retrieved_rag_chunks:
+                break
+        print(f"Orchestrator: Retrieved {len(retrieved_rag_chunks)} RAG chunks.")
+    except Exception as e: 
+        print(f"Orchestrator: Error in RAG retrieval: {str(e)}")
+    return retrieved_rag_chunks
+
 async def generate_brief_from_text_query(user_query: str, chat_history: Optional[List[ChatMessage]] = None) -> Dict[str, Any]:
     print(f"Orchestrator: Processing text query for brief: '{user_query}'")
-    portfolio_csv_content = read_portfolio_csv()
+    portfolio_summary = get_portfolio_summary(user_query)
     
-    summarized_articles_for_llm: List[ArticleDataForLLM] = []
-    scraper_search_term = user_query
     narrative_text_content = "Could not generate a narrative."
     audio_bytes_content = None
     
-    async with httpx.AsyncClient() as client:
-        scraper_search_term = await get_news_search_keywords_from_llm(user_query, client)
-        
-        try:
-            scraper_payload = {"query": scraper_search_term, "results_limit": 5, "summary_limit": 3}
-            response_scraper = await client.post(f"{SCRAPING_AGENT_URL}/scrape_summarized_news", json=scraper_payload, timeout=120.0)
-            response_scraper.raise_for_status()
-            scraped_data_list = response_scraper.json()
-            for article_data in scraped_data_list: 
-                summarized_articles_for_llm.append(ArticleDataForLLM(**article_data))
-            print(f"Orchestrator: Scraped {len(summarized_articles_for_llm)} articles.")
-        except Exception as e: 
-            print(f"Orchestrator: Error in scraping step: {str(e)}")
+    client = get_agent_client()
+    # Retrieval only needs the raw query, so it runs alongside keywords -> scraping
+    # and synthesis waits for both branches.
+    summarized_articles_for_llm, retrieved_rag_chunks = await asyncio.gather(
+        scrape_news_for_query(user_query, client),
+        retrieve_rag_chunks(user_query, client, rag_filters_for(portfolio_summary)),
+    )
+    
+    try:
+        chat_history_for_api = []
+        if chat_history:
+            for msg in chat_history:
+                chat_history_for_api.append({"role": msg.role, "content": msg.content})
         
-        retrieved_rag_chunks: List[str] = []
-        try:
-            retriever_payload = {"query": user_query, "top_k": 2}
-            response_retriever = await client.post(f"{RETRIEVER_AGENT_URL}/search", json=retriever_payload, timeout=20.0)
-            response_retriever.raise_for_status()
-            retrieved_data = response_retriever.json()
-            if "results" in retrieved_data: 
-                retrieved_rag_chunks = [item.get("page_content", "") for item in retrieved_data["results"]]
-            print(f"Orchestrator: Retrieved {len(retrieved_rag_chunks)} RAG chunks.")
-        except Exception as e: 
-            print(f"Orchestrator: Error in RAG retrieval: {str(e)}")
+        language_payload = {
+            "user_query": user_query,
+            "chat_history": chat_history_for_api,
+            "retrieved_rag_context": retrieved_rag_chunks,
+            "scraped_news_articles": [article.model_dump() for article in summarized_articles_for_llm],
+            "portfolio_summary": portfolio_summary
+        }
+        response_language = await client.post(f"{LANGUAGE_AGENT_URL}/synthesize", json=language_payload, timeout=60.0)
+        response_language.raise_for_status()
+        narrative_response = response_language.json()
+        narrative_text_content = narrative_response.get("narrative", "No narrative generated.")
+        print(f"Orchestrator: Received narrative. Length: {len(narrative_text_content)}")
         
-        try:
-            chat_history_for_api = []
-            if chat_history:
-                for msg in chat_history:
-                    chat_history_for_api.append({"role": msg.role, "content": msg.content})
-            
-            language_payload = {
-                "user_query": user_query,
-                "chat_history": chat_history_for_api,
-                "retrieved_rag_context": retrieved_rag_chunks,
-                "scraped_news_articles": [article.model_dump() for article in summarized_articles_for_llm],
-                "portfolio_csv_data": portfolio_csv_content
-            }
-            response_language = await client.post(f"{LANGUAGE_AGENT_URL}/synthesize", json=language_payload, timeout=60.0)
-            response_language.raise_for_status()
-            narrative_response = response_language.json()
-            narrative_text_content = narrative_response.get("narrative", "No narrative generated.")
-            print(f"Orchestrator: Received narrative. Length: {len(narrative_text_content)}")
-            
-            if narrative_text_content and narrative_text_content.strip():
-                try:
-                    print(f"Orchestrator: Calling TTS Agent for narrative...")
-                    tts_payload = {"text": narrative_text_content}
-                    audio_response_chunks = []
-                    async with client.stream("POST", f"{TTS_AGENT_URL}/synthesize_speech", json=tts_payload, timeout=90.0) as tts_stream_response:
-                        tts_stream_response.raise_for_status()
-                        async for chunk in tts_stream_response.aiter_bytes():
-                            audio_response_chunks.append(chunk)
-                    
-                    if audio_response_chunks:
-                        audio_bytes_content = b"".join(audio_response_chunks)
-                        print(f"Orchestrator: Received {len(audio_bytes_content)} audio bytes from TTS Agent.")
-                    else:
-                        print("Orchestrator: TTS Agent returned no audio data.")
-                except httpx.HTTPStatusError as exc_tts_status:
-                     print(f"Orchestrator: HTTP error from TTS Agent: {exc_tts_status.response.status_code} - {exc_tts_status.response.text}")
-                except Exception as e_tts:
-                    print(f"Orchestrator: Error calling TTS Agent: {str(e_tts)}")
-            else:
-                print("Orchestrator: Narrative text is empty, skipping TTS.")
+        if narrative_text_content and narrative_text_content.strip():
+            try:
+                print(f"Orchestrator: Calling TTS Agent for narrative...")
+                tts_payload = {"text": narrative_text_content}
+                audio_response_chunks = []
+                async with client.stream("POST", f"{TTS_AGENT_URL}/synthesize_speech", json=tts_payload, timeout=90.0) as tts_stream_response:
+                    tts_stream_response.raise_for_status()
+                    async for chunk in tts_stream_response.aiter_bytes():
+                        audio_response_chunks.append(chunk)
+                
+                if audio_response_chunks:
+                    audio_bytes_content = b"".join(audio_response_chunks)
+                    print(f"Orchestrator: Received {len(audio_bytes_content)} audio bytes from TTS Agent.")
+                else:
+                    print("Orchestrator: TTS Agent returned no audio data.")
+            except httpx.HTTPStatusError as exc_tts_status:
+                 print(f"Orchestrator: HTTP error from TTS Agent: {exc_tts_status.response.status_code} - {exc_tts_status.response.text}")
+            except Exception as e_tts:
+                print(f"Orchestrator: Error calling TTS Agent: {str(e_tts)}")
+        else:
+            print("Orchestrator: Narrative text is empty, skipping TTS.")
+    
+    except httpx.HTTPStatusError as exc_lang:
+        detail = exc_lang.response.json().get("detail", exc_lang.response.text)
+        raise HTTPException(status_code=exc_lang.response.status_code, detail=f"Language Agent Error: {detail}")
+    except Exception as e_lang:
+        raise HTTPException(status_code=500, detail=f"Synthesis step failed: {str(e_lang)}")
         
-        except httpx.HTTPStatusError as exc_lang:
-            detail = exc_lang.response.json().get("detail", exc_lang.response.text)
-            raise HTTPException(status_code=exc_lang.response.status_code, detail=f"Language Agent Error: {detail}")
-        except Exception as e_lang:
-            raise HTTPException(status_code=500, detail=f"Synthesis step failed: {str(e_lang)}")
-            
     audio_b64 = base64.b64encode(audio_bytes_content).decode('utf-8') if audio_bytes_content else None
     return {"narrative_text": narrative_text_content, "audio_base64": audio_b64}
 
@@ -163,13 +227,13 @@ async def process_voice_query_endpoint(audio_file: UploadFile = File(...)):
     transcribed_text = ""
     try:
         files_for_stt = {'audio_file': (audio_file.filename, await audio_file.read(), audio_file.content_type)}
-        async with httpx.AsyncClient(timeout=45.0) as client:
-            response_stt = await client.post(f"{STT_AGENT_URL}/transcribe_audio", files=files_for_stt)
-            response_stt.raise_for_status()
-            stt_data = response_stt.json()
-            transcribed_text = stt_data.get("transcribed_text")
-            if not transcribed_text or not transcribed_text.strip():
-                raise HTTPException(status_code=400, detail="Could not understand audio.")
+        client = get_agent_client()
+        response_stt = await client.post(f"{STT_AGENT_URL}/transcribe_audio", files=files_for_stt, timeout=45.0)
+        response_stt.raise_for_status()
+        stt_data = response_stt.json()
+        transcribed_text = stt_data.get("transcribed_text")
+        if not transcribed_text or not transcribed_text.strip():
+            raise HTTPException(status_code=400, detail="Could not understand audio.")
     except Exception as e_stt:
         raise HTTPException(status_code=500, detail=f"STT processing failed: {str(e_stt)}")
     
@@ -0,0 +1,5 @@
+# Agent modules import each other by bare name (main_app.py puts agents/ on sys.path), so the tests do the same.
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
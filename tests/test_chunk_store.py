@@ -0,0 +1,78 @@
+import pytest
+import numpy as np
+from chunk_store import ChunkStore
+
+DIMENSION = 16
+FILE_INFO = {"sha256": "", "size": 0, "mtime_ns": 0}
+
+
+def add_file(store, source, vectors):
+    texts = [f"{source} chunk {i}" for i in range(len(vectors))]
+    return store.add_file_chunks(source, FILE_INFO, texts, [{} for _ in texts], vectors)
+
+
+def nearest_ids(store, vectors):
+    return [hits[0][0] if hits else None for hits in store.search(vectors, 1, nprobe=10000)]
+
+
+def test_ivf_search_ids_stay_correct_across_repeated_removals():
+    rng = np.random.default_rng(0)
+    store = ChunkStore("test", {"index_type": "ivf_flat"})
+    vectors_by_id = {}
+    for i in range(40):
+        vectors = rng.standard_normal((100, DIMENSION)).astype("float32")
+        vectors_by_id.update(zip(add_file(store, f"doc{i}", vectors), vectors))
+    store.finalize()
+    assert store.index_description.startswith("IVF")
+
+    for source in ("doc3", "doc17", "doc25"): # Each removal used to shift the IDs of every later vector
+        for chunk_id in store.files[source]["chunk_ids"]:
+            del vectors_by_id[chunk_id]
+        store.remove_file(source)
+
+    assert store.ntotal == len(vectors_by_id)
+    sample = sorted(vectors_by_id)[::37]
+    assert nearest_ids(store, np.array([vectors_by_id[chunk_id] for chunk_id in sample])) == sample
+
+
+@pytest.mark.parametrize("index_type, expected_prefix", [
+    ("flat", "Flat"), ("ivf_flat", "IVF"), ("ivf_pq", "IVF"), ("hnsw", "HNSW"),
+])
+def test_incremental_update_removes_one_file_and_replaces_another(tmp_path, index_type, expected_prefix):
+    rng = np.random.default_rng(1)
+    config = {"index_type": index_type, "nlist": 16, "pq_m": 8}
+    files = {f"doc{i}": rng.standard_normal((256, DIMENSION)).astype("float32") for i in range(40)}
+    store = ChunkStore("test", config)
+    for source, vectors in files.items():
+        add_file(store, source, vectors)
+    store.save(str(tmp_path))
+    assert store.index_description.startswith(expected_prefix)
+    removed_ids = store.files["doc5"]["chunk_ids"] + store.files["doc9"]["chunk_ids"]
+
+    # Same steps as sync_chunk_store: edit a writable copy from disk, or rebuild when the index can't delete
+    del files["doc5"]
+    files["doc9"] = rng.standard_normal((50, DIMENSION)).astype("float32")
+    store = ChunkStore.load(str(tmp_path), "test", memory_map=False, index_config=config)
+    if store.supports_removal:
+        assert store.remove_file("doc5") == 256
+        assert store.remove_file("doc9") == 256
+        new_ids = add_file(store, "doc9", files["doc9"])
+    else:
+        store = ChunkStore("test", config)
+        new_ids = {source: add_file(store, source, vectors) for source, vectors in files.items()}["doc9"]
+        removed_ids = [] # A rebuilt store numbers its chunks from 0 again
+    store.save(str(tmp_path))
+    store = ChunkStore.load(str(tmp_path), "test", index_config=config)
+
+    assert store.ntotal == 38 * 256 + 50
+    assert sorted(store.chunk_ids()) == sorted(chunk_id for entry in store.files.values() for chunk_id in entry["chunk_ids"])
+    assert all(store.get_chunk(chunk_id) is None for chunk_id in removed_ids)
+    assert [store.get_chunk(chunk_id)["page_content"] for chunk_id in new_ids] == [f"doc9 chunk {i}" for i in range(50)]
+
+    hits = store.search(files["doc9"], 10, nprobe=10000, ef_search=512)
+    live_ids = set(store.chunk_ids())
+    assert all(chunk_id in live_ids for row in hits for chunk_id, _ in row)
+    if index_type == "ivf_pq": # PQ distances are approximate; the exact match only has to rank near the top
+        assert all(chunk_id in {hit_id for hit_id, _ in row} for chunk_id, row in zip(new_ids, hits))
+    else:
+        assert [row[0][0] for row in hits] == new_ids